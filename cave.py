@@ -1,77 +1,29 @@
-import sys
-import math
-import random
-import pygame
-import os
-
-from scripts.utils import load_image, load_images, Animation
-from scripts.entities import PhysicsEntity, Player, Enemy, Chest
-from scripts.tilemap import Tilemap
-from scripts.particle import Particle
-from scripts.spark import Spark
-
-class Game:
-    def __init__(self):
-        pygame.init()
+import time
 
-        pygame.display.set_caption('pypypy in cave game')
-        self.screen = pygame.display.set_mode((1920, 1080))
-        self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
-        self.display_2 = pygame.Surface((320, 240))
+IMPORT_START = time.perf_counter()  # Start of the startup report
 
-        self.clock = pygame.time.Clock()
+import pygame
 
-        self.movement_x = [False, False]
-        self.movement_y = [False, False]
-        self.font = pygame.font.Font(None, 23)
+from scripts import engine
+from scripts.engine import Engine
+from scripts.entities import Chest
+from scripts.hud import TextCache, HUD, Label, Bar, Image
+from scripts.minimap import Minimap, MinimapWidget
+
+class Game(Engine):
+    screen_size = (1920, 1080)
+    asset_names = [
+        'decor', 'grass', 'large_decor', 'stone',
+        'background', 'chest', 'start_menu', 'enemy/idle',
+        'enemy/run', 'player/idle', 'player/run', 'player/jump',
+        'player/slide', 'particle/leaf', 'particle/particle',
+    ]
+    startup_assets = ('start_menu', 'chest')  # The menu image, and the chest placed with the first level
+    player_start = (100, 100)
+    move_speed = 0.75
+
+    def setup(self):
         self.font2 = pygame.font.Font(None, 32)
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player.png'),
-            'background': load_image('bg1.jpg'),
-            'cirlce': load_image('circle.jpg'),
-            'chest': load_image('chest.png'),
-            'start_menu': load_image('start_menu.jpg'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'), img_dur=6),
-            'enemy/run': Animation(load_images('entities/enemy/run'), img_dur=4),
-            'player/idle': Animation(load_images('entities/player/idle'), img_dur=6),
-            'player/run': Animation(load_images('entities/player/run'), img_dur=4),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'gun': load_image('gun.png'),
-            'projectile': load_image('projectile.png'),
-        }
-
-        self.sfx = {
-            'jump': pygame.mixer.Sound('ninja_data/sfx/jump.wav'),
-            'ambience': pygame.mixer.Sound('ninja_data/sfx/ambience.wav'),
-            'dash': pygame.mixer.Sound('ninja_data/sfx/dash.wav'),
-            'shoot': pygame.mixer.Sound('ninja_data/sfx/shoot.wav'),
-            'hit': pygame.mixer.Sound('ninja_data/sfx/hit.wav'),
-        }
-
-        self.sfx['ambience'].set_volume(0.2)
-        self.sfx['jump'].set_volume(0.7)
-        self.sfx['shoot'].set_volume(0.4)
-        self.sfx['dash'].set_volume(0.3)
-        self.sfx['hit'].set_volume(0.8)
-
-        self.player = Player(self, (100, 100), (8, 15))
-
-        self.tilemap = Tilemap(self, tile_size=16)
-
-        self.level = 0
-
-        self.load_level(0)
-
-        self.screenshake = 0
-
-        
 
         self.start_time = pygame.time.get_ticks()  # Record the start time
         self.time_limit = 2 * 60 * 1000  # 2 minutes in milliseconds
@@ -80,15 +32,48 @@ class Game:
 
         self.paused = False
 
-        self.state = "menu"  # Add game state: "menu" or "game"
+        self.state = "menu"  # Add game state: "menu", "game" or "end"
         self.menu_font = pygame.font.SysFont(None, 80)  # Font for menu
 
         self.total_time = 60  # Total time in seconds
-        self.time_left = self.total_time * 60  # Convert time to frames (assuming 60 FPS)
+        self.time_left = self.total_time * self.loop.rate  # Convert time to simulation steps
         self.timer_finished = False  # To track if the timer has ended
         self.quit_delay = 0  # Delay for quitting after timer ends
 
-    
+        self.text_cache = TextCache()
+        RED = (255, 0, 0)
+        self.hud = HUD()
+        self.hud.add('health', Bar((240, 920), (200, 15), (255, 20, 147)))  # Pink bar
+        self.hud.add('health_label', Label(self.text_cache, self.font, RED, (440, 920), value="<-Health "))
+        self.hud.add('timer', Bar((240, 950), (200, 10), (0, 0, 255)))  # Blue bar
+        self.hud.add('timer_label', Label(self.text_cache, self.font, RED, (440, 950), value="<-Time left "))
+        self.hud.add('points', Label(self.text_cache, self.font2, (255, 0, 127), (1500, 940), fmt="Points: {}"))
+
+        # Level overview, toggled with M; kept up to date even while hidden
+        self.minimap = Minimap(self.tilemap)
+        self.minimap_widget = MinimapWidget(self.minimap, (1700, 20), (200, 150), zoom=2)
+        self.show_minimap = False
+
+        self.menu = HUD(bg=(0, 0, 0))
+        self.menu.add('image', Image((140, 80), self.assets['start_menu']))
+
+        self.game_over_menu = HUD(bg=(0, 0, 0))
+        self.game_over_menu.add('title', Label(self.text_cache, self.menu_font, (255, 255, 255), (900, 400), value='Game Over'))
+        self.game_over_menu.add('restart', Label(self.text_cache, self.menu_font, (255, 255, 255), (900, 500), value='Press Enter to Restart'))
+
+        add = self.systems.add
+        self.add_menu_systems()
+        add('update', 'end menu input', self.end_menu_input, states=('end',))
+        add('render', 'draw end menu', self.draw_end_menu, states=('end',))
+
+        self.add_game_systems()
+        add('update', 'level', self.update_level, order=15)
+        add('update', 'hud', self.update_hud, order=80)
+        add('update', 'timer', self.update_timer, order=90)
+        add('render', 'hud', self.draw_hud, order=90)
+
+        # The first game frame can be rendered before any game update has run
+        self.update_hud()
 
     def player_hit(self, damage):
         self.player.health -= damage
@@ -100,293 +85,124 @@ class Game:
             self.player.velocity[1] *= 0.5
             self.clamp_player_position()
 
-    
+
     def clamp_player_position(self):
     # Make sure the player doesn't go out of bounds on X-axis
         self.player.pos[0] = max(0, min(640 * self.tilemap.tile_size - self.player.rect().width, self.player.pos[0]))
-    
+
     # Make sure the player doesn't go out of bounds on Y-axis
         self.player.pos[1] = max(0, min(480 * self.tilemap.tile_size - self.player.rect().height, self.player.pos[1]))
 
-    def draw_health_bar(self):
-        # Draw a pink health bar at the bottom of the screen
-        health_percentage = self.player.health / 100
-        health_bar_width = 200  # Full width of health bar
-        health_bar_height = 15  # Height of the health bar
-        filled_health = health_bar_width * health_percentage
-        pygame.draw.rect(self.screen, (255, 20, 147), (240, 920, filled_health, health_bar_height))  # Pink bar
-        pygame.draw.rect(self.screen, (0, 0, 0), (240, 920, health_bar_width, health_bar_height), 2)  # Black border
+    def update_health_bar(self):
+        # Pink health bar at the bottom of the screen, redrawn by the HUD only when it changes
+        self.hud.set('health', self.player.health / 100)
         if self.player.health <= 0:
             self.dead = True
             self.state = "menu"
             self.player.health = 100
             self.time_percentage = 100
-            
-
-        RED=(255,0,0)
-        text = self.font.render("<-Health ", True, RED)
-    
-        # Get the rect of the text surface
-        text_rect = text.get_rect()
-    
-        # Position the text at a specific point (e.g., (100, 100))
-        text_rect.topleft = (440, 920)
-    
-        # Draw the text onto the screen
-        self.screen.blit(text, text_rect)
-
-    def show_points(self):
+
+    def update_points(self):
         self.points =0
-        BLUE=(255,0,127)
-        text = self.font2.render(f"Points: {self.points}", True, BLUE)
-    
-        # Get the rect of the text surface
-        text_rect = text.get_rect()
-    
-        # Position the text at a specific point (e.g., (100, 100))
-        text_rect.topleft = (1500,940)
-    
-        # Draw the text onto the screen
-        self.screen.blit(text, text_rect)
-        
-    
-    def draw_timer_bar(self):
-        # Draw a blue timer bar beneath the health bar
-        self.time_percentage = self.time_left / (self.total_time * 60)
-        timer_bar_width = 200  # Full width of timer bar
-        timer_bar_height = 10  # Height of the timer bar
-        filled_time = timer_bar_width * self.time_percentage
-        pygame.draw.rect(self.screen, (0, 0, 255), (240, 950, filled_time, timer_bar_height))  # Blue bar
-        pygame.draw.rect(self.screen, (0, 0, 0), (240, 950, timer_bar_width, timer_bar_height), 2)  # Black border
-        
-        RED=(255,0,0)
-        text = self.font.render("<-Time left ", True, RED)
-    
-        # Get the rect of the text surface
-        text_rect = text.get_rect()
-    
-        # Position the text at a specific point (e.g., (100, 100))
-        text_rect.topleft = (440, 950)
-    
-        # Draw the text onto the screen
-        self.screen.blit(text, text_rect)
-
-
-    def load_level(self, map_id):
-        self.tilemap.load('ninja_data/maps/' + str(map_id) + '.json')
-
-        self.leaf_spawners = []
-        for tree in self.tilemap.extract([('large_decor', 2)], keep=True):
-            self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
-
-        self.enemies = []
-        for spawner in self.tilemap.extract([('spawners', 0), ('spawners', 1)]):
-            if spawner['variant'] == 0:
-                self.player.pos = spawner['pos']
-            else:
-                self.enemies.append(Enemy(self, spawner['pos'], (8, 15)))
-
-        while True:
-            random_x = random.randint(0, self.tilemap.width - 1) * self.tilemap.tile_size
-            random_y = random.randint(0, self.tilemap.height - 1) * self.tilemap.tile_size
-            random_pos = (random_x, random_y)
-            if not self.tilemap.is_solid(random_pos):  # Ensure chest doesn't spawn on a solid tile
-                self.chest = Chest(self, (random_x, random_y))
-                break
-        
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
-
-        self.scroll = [0, 0]
-        self.dead = 0
-        # Update chest and check collision with player
-
-        self.transition = -30
-    
-    def end_menu(self):
-        self.screen.fill((0, 0, 0))
-        end_surface = self.menu_font.render('Game Over', True, (255, 255, 255))
-        restart_surface = self.menu_font.render('Press Enter to Restart', True, (255, 255, 255))
-        self.screen.blit(end_surface, (900, 400))
-        self.screen.blit(restart_surface, (900, 500))
-        pygame.display.update()
-
-    def display_menu(self):
-        self.screen.fill((0, 0, 0))
-        # title_surface = self.menu_font.render('Cave Game', True, (255, 255, 255))
-        # start_surface = self.menu_font.render('Press Enter to Start', True, (255, 255, 255))
-        # quit_surface = self.menu_font.render('Press Q to Quit', True, (255, 255, 255))
-
-        self.screen.blit(self.assets['start_menu'], (140, 80))
-
-
-        # self.screen.blit(title_surface, (120, 100))
-        # self.screen.blit(start_surface, (50, 200))
-        # self.screen.blit(quit_surface, (80, 300))
-
-        pygame.display.update()
-
-        for event in pygame.event.get():
+        self.hud.set('points', self.points)
+
+    def update_timer_bar(self):
+        # Blue timer bar beneath the health bar
+        self.time_percentage = self.time_left / (self.total_time * self.loop.rate)
+        self.hud.set('timer', self.time_percentage)
+
+    def level_loaded(self, level):
+        self.chest = Chest(self, level.chest_position(self.rng))
+
+    def enemy_killed(self, enemy):
+        self.score += 1
+
+    def reset(self, seed=None, map_id=0):
+        super().reset(seed, map_id)
+        self.time_left = self.total_time * self.loop.rate
+        self.timer_finished = False
+        self.quit_delay = 0
+
+    def state_changed(self, previous):
+        super().state_changed(previous)
+        if previous == "game":
+            self.game_over_menu.invalidate()
+
+    def end_menu_input(self):
+        for event in self.events.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                self.quit()
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:  # Start game when Enter is pressed
+                if event.key == pygame.K_RETURN:
                     self.state = "game"
+                    self.player.health = 100
+                    self.time_percentage = 100
+                    self.time_left = self.total_time * self.loop.rate
+                    self.timer_finished = False
+                    break
                 if event.key == pygame.K_q:  # Quit game
-                    pygame.quit()
-                    sys.exit()
-
-    def run(self):
-        pygame.mixer.music.load('ninja_data/music.wav')
-        pygame.mixer.music.set_volume(0.5)
-        pygame.mixer.music.play(-1)
-        self.sfx['ambience'].play(-1)
-
-        while True:
-            if self.state == "menu":
-                self.display_menu()  # Display the menu until player starts the game
-            elif self.state == "game":
-                self.display.fill((0, 0, 0, 0))
-                self.display_2.blit(self.assets['background'], (0, 0))
-
-                self.screenshake = max(0, self.screenshake - 1)
-
-                if not len(self.enemies):
-                    self.transition += 1
-                    if self.transition > 30:
-                        self.level = min(len(os.listdir('ninja_data/maps')) - 1, self.level + 1)
-                        self.load_level(self.level)
-                if self.transition < 0:
-                    self.transition = 0
-
-                elapsed_time = pygame.time.get_ticks() - self.start_time
-                remaining_time = max(0, self.time_limit - elapsed_time)
-                minutes = remaining_time // 60000
-                seconds = (remaining_time % 60000) // 1000
-
-                if remaining_time > 0:
-                    timer_text = f'{minutes}:{seconds:02}'
-                else:
-                    timer_text = '!'  # Show exclamation mark when time hits zero
-
-                if self.dead:
-                    self.dead += 1
-                    if self.dead >= 10:
-                        self.transition = min(self.transition + 1, 30)
-                    if self.dead > 40:
-                        self.load_level(self.level)
-
-                self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
-                self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
-                render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-                self.tilemap.render(self.display, offset=render_scroll)
-
-                for enemy in self.enemies.copy():
-                    kill = enemy.update(self.tilemap, (0, 0))
-                    enemy.render(self.display, offset=render_scroll)
-                    if kill:
-                        self.enemies.remove(enemy)
-                        self.score += 1
-
-                if not self.dead:
-                    self.player.update(self.tilemap, ((self.movement_x[1] - self.movement_x[0])*0.75, (self.movement_y[1] - self.movement_y[0])*0.75))
-                    self.player.render(self.display, offset=render_scroll)
-
-                for spark in self.sparks.copy():
-                    kill = spark.update()
-                    spark.render(self.display, offset=render_scroll)
-                    if kill:
-                        self.sparks.remove(spark)
-
-                display_mask = pygame.mask.from_surface(self.display)
-                display_sillhouette = display_mask.to_surface(setcolor=(0,0,0,180), unsetcolor=(0,0,0,0))
-
-                for offset in [(-1,0), (1,0), (0,1), (0,-1)]:
-                    self.display_2.blit(display_sillhouette, offset)
-
-                for particle in self.particles.copy():
-                    kill = particle.update()
-                    particle.render(self.display, offset=render_scroll)
-                    if particle.type == 'leaf':
-                        particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                    if kill:
-                        self.particles.remove(particle)
-
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        sys.exit()
-                    if event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_b:
-                            sys.exit()
-                        if event.key == pygame.K_a:
-                            self.movement_x[0] = True
-                        if event.key == pygame.K_d:
-                            self.movement_x[1] = True
-                        if event.key == pygame.K_w:
-                            self.movement_y[0] = True
-                        if event.key == pygame.K_s:
-                            self.movement_y[1] = True
-                        if event.key == pygame.K_x:
-                            self.player.dash()
-
-                    if event.type == pygame.KEYUP:
-                        if event.key == pygame.K_a:
-                            self.movement_x[0] = False
-                        if event.key == pygame.K_d:
-                            self.movement_x[1] = False
-                        if event.key == pygame.K_w:
-                            self.movement_y[0] = False
-                        if event.key == pygame.K_s:
-                            self.movement_y[1] = False
-
-                if self.transition:
-                    transition_surf = pygame.Surface(self.display.get_size())
-                    pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width() // 2, self.display.get_height() // 2), (30 - abs(self.transition)) * 8)
-                    transition_surf.set_colorkey((255, 255, 255))
-                    self.display.blit(transition_surf, (0, 0))
-
-                self.display_2.blit(self.display, (0, 0))
-
-                screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2) 
-                self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset)
-
-
-
-                # Draw health, timer, and points after the circle
-                self.draw_health_bar()
-                self.draw_timer_bar()
-                self.show_points()
-
-                if self.time_left > 0:
-                    self.time_left -= 1
-                else:
-                    if not self.timer_finished:
-                        self.timer_finished = True
-                        self.quit_delay = 60  # 2 seconds delay (60 frames at 60 FPS)
-                    elif self.quit_delay > 0:
-                        self.quit_delay -= 1
-                    else:
-                        self.end_menu()
-                        for event in pygame.event.get():
-                            if event.type == pygame.QUIT:
-                                pygame.quit()
-                                sys.exit()
-                            if event.type == pygame.KEYDOWN:
-                                if event.key == pygame.K_RETURN:
-                                    self.state = "game"
-                                    self.player.health = 100
-                                    self.time_percentage = 100
-                                    break
-                                if event.key == pygame.K_q:  # Quit game
-                                    pygame.quit()
-                                    sys.exit()
-
-            pygame.display.update()
-            self.clock.tick(60)
-
-
-Game().run()
\ No newline at end of file
+                    self.quit()
+
+    def draw_end_menu(self):
+        self.dirty += self.game_over_menu.draw(self.screen)
+
+    def update_level(self):
+        if not len(self.enemies):
+            self.transition += 1
+            if self.transition > 30:
+                self.level = self.levels.next_level(self.level)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition = 0
+
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(self.transition + 1, 30)
+            if self.dead > 40:
+                self.load_level(self.level)
+
+    def update_hud(self):
+        # Health, timer, and points are drawn by the HUD after the circle
+        self.update_health_bar()
+        self.update_timer_bar()
+        self.update_points()
+        if self.show_minimap:
+            self.update_minimap()
+
+    def update_minimap(self):
+        # Rebuilt only when the player reaches another tile or the level changes
+        center = self.player.rect().center
+        self.hud.set('minimap', (center[0] / self.tilemap.tile_size, center[1] / self.tilemap.tile_size))
+
+    def key_down(self, key):
+        if key == pygame.K_m:
+            self.show_minimap = not self.show_minimap
+            if self.show_minimap:
+                self.hud.add('minimap', self.minimap_widget)
+                self.update_minimap()
+            else:
+                self.hud.remove('minimap')
+
+    def update_timer(self):
+        if self.time_left > 0:
+            self.time_left -= 1
+        else:
+            if not self.timer_finished:
+                self.timer_finished = True
+                self.quit_delay = 60  # 2 seconds delay (60 frames at 60 FPS)
+            elif self.quit_delay > 0:
+                self.quit_delay -= 1
+            else:
+                self.state = "end"
+
+    def draw_hud(self):
+        self.hud.draw(self.screen, force=True)
+
+
+def main(argv=None):
+    engine.main(Game, argv, IMPORT_START)
+
+
+if __name__ == '__main__':
+    main()
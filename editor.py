@@ -1,7 +1,10 @@
 import pygame
 import sys
-from scripts.utils import load_images
+from scripts.assets import AssetManager
 from scripts.tilemap import Tilemap
+from scripts.present import Presenter
+from scripts.journal import EditJournal, Autosave, has_autosave, recover
+from scripts.minimap import Minimap, MinimapWidget
 
 RENDER_SCALE =2.0
 
@@ -10,27 +13,28 @@ class Editor:
         pygame.init()
         self.screen = pygame.display.set_mode((640,480))
         self.display = pygame.Surface((320 ,240))
+        self.presenter = Presenter(self.screen, self.display.get_size())
 
         self.clock = pygame.time.Clock()
         pygame.display.set_caption("Editor")
 
         self.tilemap = Tilemap(self , tile_size=16)
 
-        self.assets = {
-            'decor' : load_images('tiles/decor'),
-            'grass' : load_images('tiles/grass'),
-            'large_decor' : load_images('tiles/large_decor'),
-            'stone' : load_images('tiles/stone'),
-            'spawners':load_images('tiles/spawners')
-        }
+        self.assets = AssetManager(['decor', 'grass', 'large_decor', 'stone', 'spawners'])
+        self.assets.preload()
         self.movement = [False , False , False , False]
 
         self.scroll = [0,0]
 
-        try:
-            self.tilemap.load('map.json')
-        except FileNotFoundError:
-            pass
+        # Unsaved edits from the last session live beside map.json until O
+        # saves them; Ctrl+R goes back to map.json instead
+        if has_autosave('map.json'):
+            recover(self.tilemap, 'map.json')
+            print('Restored unsaved edits from map.json.autosave: O saves them to map.json, Ctrl+R reverts to it')
+        else:
+            self.load('map.json')
+        self.journal = EditJournal(self.tilemap)
+        self.autosave = Autosave(self.tilemap, self.journal, 'map.json')
 
         self.tile_list = list(self.assets)
         self.tile_group = 0
@@ -40,6 +44,47 @@ class Editor:
         self.shift = False
         self.ongrid = True
 
+        # Grid tools: 'brush' paints strokes, 'rect' fills the dragged box,
+        # 'fill' flood fills. Right button erases with the same tool.
+        self.tool = 'brush'
+        self.brush_size = 0  # Extra tiles around the brush centre
+        self.autotiling = True  # Tools autotile just the area they changed
+        self.last_cell = None
+        self.drag_start = None
+        pygame.display.set_caption("Editor - brush")
+
+        # Overview in the corner, M toggles it and -/= zoom out and in
+        self.minimap = Minimap(self.tilemap)
+        self.minimap_widget = MinimapWidget(self.minimap, (470, 10), (160, 120), zoom=1)
+        self.show_minimap = True
+        self.autosave_error = None  # The autosave error already shown
+
+    def load(self, path):
+        try:
+            self.tilemap.load(path)
+        except FileNotFoundError:
+            self.tilemap.tilemap = {}
+            self.tilemap.offgrid_tiles = []
+            self.tilemap.notify(None)
+
+    def revert(self):
+        self.autosave.discard()
+        self.load('map.json')
+        print('Reverted to map.json')
+
+    def select_tool(self, tool):
+        self.tool = tool
+        pygame.display.set_caption("Editor - " + tool)
+
+    def quit(self):
+        self.autosave.close()
+        pygame.quit()
+        sys.exit()
+
+    def current_type(self):
+        # What the held button paints: the selected tile, or nothing when erasing
+        return self.tile_list[self.tile_group] if self.clicking else None
+
     def run(self):
         while True:
             self.display.fill((0,0,0))
@@ -62,32 +107,45 @@ class Editor:
             else:
                 self.display.blit(current_tile_img , mpos)
 
-            if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';'+ str(tile_pos[1])] = {'type': self.tile_list[self.tile_group] , 'variant':self.tile_variant , 'pos':tile_pos}
+            if (self.clicking or self.right_clicking) and self.ongrid and self.tool == 'brush':
+                # Only when the cursor reaches a new cell, joining it to the last
+                # one so fast strokes don't leave gaps
+                if tile_pos != self.last_cell:
+                    self.tilemap.paint_line(self.last_cell or tile_pos, tile_pos, self.current_type(), self.tile_variant, self.brush_size, self.autotiling)
+                    self.last_cell = tile_pos
+            if self.drag_start:
+                x0, x1 = sorted((self.drag_start[0], tile_pos[0]))
+                y0, y1 = sorted((self.drag_start[1], tile_pos[1]))
+                size = self.tilemap.tile_size
+                pygame.draw.rect(self.display, (255, 255, 255), (x0 * size - self.scroll[0], y0 * size - self.scroll[1], (x1 - x0 + 1) * size, (y1 - y0 + 1) * size), 1)
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
                 for tile in self.tilemap.offgrid_tiles.copy():
                     tile_img = self.assets[tile['type']][tile['variant']]
                     tile_r = pygame.Rect(tile['pos'][0]- self.scroll[0] , tile['pos'][1] - self.scroll[1] , tile_img.get_width() , tile_img.get_height())
                     if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                        self.tilemap.remove_offgrid(tile)
 
             self.display.blit(current_tile_img , (5,5))
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    self.quit()
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button in (1, 3):
+                        self.journal.begin()  # One undo step per press
                     if event.button == 1:
                         self.clicking = True
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group] , 'variant':self.tile_variant , 'pos':(mpos[0]+self.scroll[0] , mpos[1] + self.scroll[1])})
+                            self.tilemap.add_offgrid({'type': self.tile_list[self.tile_group] , 'variant':self.tile_variant , 'pos':(mpos[0]+self.scroll[0] , mpos[1] + self.scroll[1])})
                     if event.button == 3:
                         self.right_clicking = True
+                    if event.button in (1, 3) and self.ongrid:
+                        self.last_cell = None
+                        if self.tool == 'rect':
+                            self.drag_start = tile_pos
+                        if self.tool == 'fill':
+                            self.tilemap.flood_fill(tile_pos, self.current_type(), self.tile_variant, autotile=self.autotiling)
                     if self.shift:
                         if event.button == 4:
                             self.tile_variant = (self.tile_variant - 1) % len(self.assets[self.tile_list[self.tile_group]])
@@ -102,10 +160,15 @@ class Editor:
                             self.tile_variant = 0
                     
                 if event.type == pygame.MOUSEBUTTONUP:
+                    if event.button in (1, 3) and self.drag_start:
+                        self.tilemap.fill_rect(self.drag_start, tile_pos, self.current_type(), self.tile_variant, self.autotiling)
+                        self.drag_start = None
                     if event.button == 1:
                         self.clicking = False
                     if event.button == 3:
                         self.right_clicking = False
+                    if not (self.clicking or self.right_clicking):
+                        self.journal.end()
 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_a:
@@ -123,7 +186,36 @@ class Editor:
                     if event.key == pygame.K_g:
                         self.ongrid = not self.ongrid
                     if event.key == pygame.K_o:
-                        self.tilemap.save('map.json')
+                        self.autosave.save()  # Written on the autosave thread
+                    if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                        if event.mod & pygame.KMOD_SHIFT:
+                            self.journal.redo()
+                        else:
+                            self.journal.undo()
+                    if event.key == pygame.K_b:
+                        self.select_tool('brush')
+                    if event.key == pygame.K_r:
+                        if event.mod & pygame.KMOD_CTRL:
+                            self.revert()
+                        else:
+                            self.select_tool('rect')
+                    if event.key == pygame.K_f:
+                        self.select_tool('fill')
+                    if event.key == pygame.K_y:
+                        if event.mod & pygame.KMOD_CTRL:
+                            self.journal.redo()
+                        else:
+                            self.autotiling = not self.autotiling
+                    if event.key == pygame.K_m:
+                        self.show_minimap = not self.show_minimap
+                    if event.key == pygame.K_MINUS:
+                        self.minimap_widget.zoom = max(1 / 32, self.minimap_widget.zoom / 2)
+                    if event.key == pygame.K_EQUALS:
+                        self.minimap_widget.zoom = min(8, self.minimap_widget.zoom * 2)
+                    if event.key == pygame.K_LEFTBRACKET:
+                        self.brush_size = max(0, self.brush_size - 1)
+                    if event.key == pygame.K_RIGHTBRACKET:
+                        self.brush_size = min(8, self.brush_size + 1)
                     
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_a:
@@ -138,7 +230,24 @@ class Editor:
                         self.shift = False
                 
                 
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()) , (0,0))        
+            self.autosave.tick()
+            if self.autosave.error is not self.autosave_error:
+                # Shown once; the side files or map.json may be out of date
+                self.autosave_error = self.autosave.error
+                print(f'Saving failed: {self.autosave_error}')
+                pygame.display.set_caption(f'Editor - saving failed: {self.autosave_error}')
+            self.presenter.present(self.display)
+            if self.show_minimap:
+                size = self.tilemap.tile_size
+                self.minimap_widget.set(((self.scroll[0] + self.display.get_width() / 2) / size, (self.scroll[1] + self.display.get_height() / 2) / size))
+                self.screen.blit(self.minimap_widget.surf, self.minimap_widget.rect)
             pygame.display.update()
             self.clock.tick(60)
-Editor().run()
+
+
+def main():
+    Editor().run()
+
+
+if __name__ == '__main__':
+    main()
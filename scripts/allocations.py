@@ -0,0 +1,241 @@
+import gc
+import sys
+import argparse
+import importlib
+import tracemalloc
+
+import pygame
+
+from scripts.headless import demo_input
+from scripts.profiler import FrameProfiler
+
+
+class AllocationScope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.profiler.current = self.name
+        self.start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def __exit__(self, *exc):
+        # Highest extra memory held at once while the system ran: a lower
+        # bound on what it allocated, including temporaries freed again
+        self.profiler.add(self.name, tracemalloc.get_traced_memory()[1] - self.start)
+        self.profiler.current = None
+
+
+class AllocationProfiler(FrameProfiler):
+    # Drop-in for a game's profiler: the scheduler opens one scope per
+    # system, and each scope measures memory instead of time.
+    def __init__(self):
+        super().__init__()
+        self.enabled = True
+        self.peaks = {}
+        self.frame_peaks = []
+        self.frame_peak = 0
+        # New SDL surfaces, which tracemalloc can't see: see SurfaceCounter
+        self.current = None  # The system running now
+        self.surface_bytes = {}
+        self.frame_surfaces = []  # (count, bytes) per frame
+        self.frame_surface = [0, 0]
+
+    def scope(self, name):
+        if name not in self.scopes:
+            self.scopes[name] = AllocationScope(self, name)
+        return self.scopes[name]
+
+    def add(self, name, peak):
+        self.peaks[name] = self.peaks.get(name, 0) + peak
+        self.frame_peak += peak
+
+    def add_surface(self, surface):
+        size = surface.get_pitch() * surface.get_height()
+        name = self.current or 'outside systems'
+        self.surface_bytes[name] = self.surface_bytes.get(name, 0) + size
+        self.frame_surface[0] += 1
+        self.frame_surface[1] += size
+
+    def toggle(self):
+        pass
+
+    def end_frame(self, **counts):
+        self.frame_peaks.append(self.frame_peak)
+        self.frame_peak = 0
+        self.frame_surfaces.append(tuple(self.frame_surface))
+        self.frame_surface = [0, 0]
+
+
+def is_new(result, args, kwargs):
+    # pygame functions given a destination surface return it instead of a new one
+    return isinstance(result, pygame.surface.Surface) and not any(result is arg for arg in (*args, *kwargs.values()))
+
+
+class SurfaceCounter:
+    # While active, reports every surface made through pygame.Surface,
+    # Mask.to_surface or a pygame.transform function to the profiler. Masks
+    # are only counted when they come from mask.from_surface, and text
+    # rendered by fonts isn't counted.
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.saved = []
+
+    def patch(self, module, name, value):
+        self.saved.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def __enter__(self):
+        profiler = self.profiler
+
+        class CountedSurface(pygame.Surface):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                profiler.add_surface(self)
+
+        class CountedMask(pygame.mask.Mask):
+            def to_surface(self, *args, **kwargs):
+                surface = super().to_surface(*args, **kwargs)
+                if is_new(surface, args, kwargs):
+                    profiler.add_surface(surface)
+                return surface
+
+        def counted(func):
+            def wrapper(*args, **kwargs):
+                result = func(*args, **kwargs)
+                if is_new(result, args, kwargs):
+                    profiler.add_surface(result)
+                return result
+            return wrapper
+
+        from_surface = pygame.mask.from_surface
+
+        def counted_from_surface(*args, **kwargs):
+            mask = from_surface(*args, **kwargs)
+            counted_mask = CountedMask(mask.get_size())
+            counted_mask.draw(mask, (0, 0))
+            return counted_mask
+
+        self.patch(pygame, 'Surface', CountedSurface)
+        self.patch(pygame.mask, 'from_surface', counted_from_surface)
+        for name in dir(pygame.transform):
+            if not name.startswith('_') and callable(getattr(pygame.transform, name)):
+                self.patch(pygame.transform, name, counted(getattr(pygame.transform, name)))
+        return self
+
+    def __exit__(self, *exc):
+        while self.saved:
+            module, name, value = self.saved.pop()
+            setattr(module, name, value)
+
+
+def measure(game_module='cave', map_id=0, frames=300, warmup=60, seed=0, render=True, top=10):
+    # Runs headless frames of one level under tracemalloc. Warmup frames fill
+    # the caches (text, atlases, transitions) so they don't count as churn.
+    # tracemalloc only sees Python objects; surface pixels are counted apart.
+    game = importlib.import_module(game_module).Game(headless=True)
+    game.reset(seed=seed, map_id=map_id)
+    game.events = demo_input()
+
+    def step():
+        game.update()
+        if render:
+            game.render()
+            pygame.display.update()
+
+    for _ in range(warmup):
+        step()
+
+    profiler = AllocationProfiler()
+    game.profiler = profiler
+    game.systems.profiler = profiler
+
+    collections = [0]
+
+    def count_collections(phase, info):
+        if phase == 'start' and info['generation'] == 0:
+            collections[0] += 1
+
+    gc.callbacks.append(count_collections)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        with SurfaceCounter(profiler):
+            for _ in range(frames):
+                step()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(count_collections)
+
+    # Net growth by source line, ignoring tracemalloc's own bookkeeping
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    lines = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    lines = [stat for stat in lines if stat.size_diff > 0][:top]
+
+    peaks = sorted(profiler.frame_peaks)
+    return {
+        'frames': frames,
+        'peak_bytes_per_frame': sum(peaks) / frames,
+        'p95_peak_bytes': peaks[int(frames * 0.95)],
+        'retained_bytes_per_frame': sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / frames,
+        'gc_collections_per_frame': collections[0] / frames,
+        'systems': {name: peak / frames for name, peak in profiler.peaks.items()},
+        'surfaces_per_frame': sum(count for count, _ in profiler.frame_surfaces) / frames,
+        'surface_bytes_per_frame': sum(size for _, size in profiler.frame_surfaces) / frames,
+        'surface_systems': {name: size / frames for name, size in profiler.surface_bytes.items()},
+        'lines': [(str(stat.traceback[0]), stat.size_diff / frames, stat.count_diff / frames) for stat in lines],
+    }
+
+
+def over_budget(result, max_kb=None, max_retained_kb=None, max_surface_kb=None):
+    # Messages for every budget the run broke; empty when within budget
+    failures = []
+    if max_kb is not None and result['peak_bytes_per_frame'] > max_kb * 1024:
+        failures.append(f"{result['peak_bytes_per_frame'] / 1024:.1f} KiB allocated per frame, budget {max_kb} KiB")
+    if max_surface_kb is not None and result['surface_bytes_per_frame'] > max_surface_kb * 1024:
+        failures.append(f"{result['surface_bytes_per_frame'] / 1024:.1f} KiB of new surfaces per frame, budget {max_surface_kb} KiB")
+    if max_retained_kb is not None and result['retained_bytes_per_frame'] > max_retained_kb * 1024:
+        failures.append(f"{result['retained_bytes_per_frame'] / 1024:.2f} KiB retained per frame, budget {max_retained_kb} KiB")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report per-frame allocations of a headless run. '
+                                     'tracemalloc only sees Python objects, so new SDL surfaces are counted separately.')
+    parser.add_argument('--game', default='cave')
+    parser.add_argument('--map', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-kb', type=float, help='fail if a frame allocates more than this many KiB of Python objects on average')
+    parser.add_argument('--max-retained-kb', type=float, help='fail if memory grows by more than this many KiB per frame')
+    parser.add_argument('--max-surface-kb', type=float, help='fail if a frame makes more than this many KiB of new surfaces on average')
+    args = parser.parse_args()
+
+    result = measure(args.game, args.map, args.frames, args.warmup, args.seed, not args.no_render, args.top)
+    print(f"{result['frames']} frames: {result['peak_bytes_per_frame'] / 1024:.1f} KiB/frame allocated (p95 {result['p95_peak_bytes'] / 1024:.1f} KiB), "
+          f"{result['retained_bytes_per_frame']:.0f} B/frame retained, {result['gc_collections_per_frame']:.2f} gen0 collections/frame")
+    print(f"surfaces: {result['surfaces_per_frame']:.2f} new/frame, {result['surface_bytes_per_frame'] / 1024:.1f} KiB/frame")
+    print('by system (allocated per frame):')
+    for name, peak in sorted(result['systems'].items(), key=lambda item: -item[1]):
+        if peak:
+            print(f'  {name:<16} {peak:10.0f} B')
+    print('by system (new surface bytes per frame):')
+    for name, size in sorted(result['surface_systems'].items(), key=lambda item: -item[1]):
+        print(f'  {name:<16} {size:10.0f} B')
+    print('by line (net growth per frame):')
+    for line, size, count in result['lines']:
+        print(f'  {line:<48} {size:10.1f} B {count:8.2f} blocks')
+
+    failures = over_budget(result, args.max_kb, args.max_retained_kb, args.max_surface_kb)
+    for failure in failures:
+        print('over budget: ' + failure)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,268 @@
+import io
+import os
+import time
+import struct
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.utils import BASE_IMG_PATH, image_names
+from scripts.atlas import Atlas
+
+CACHE_DIR = '.cache/images'
+
+# name: (loader, path, options). 'image' is a single file, the other loaders
+# name the atlas a directory of frames is packed into.
+ASSETS = {
+    'decor': ('tiles', 'tiles/decor', {}),
+    'grass': ('tiles', 'tiles/grass', {}),
+    'large_decor': ('tiles', 'tiles/large_decor', {}),
+    'stone': ('tiles', 'tiles/stone', {}),
+    'spawners': ('tiles', 'tiles/spawners', {}),
+    'player': ('image', 'entities/player.png', {}),
+    'background': ('image', 'bg1.jpg', {}),
+    'cirlce': ('image', 'circle.jpg', {}),
+    'chest': ('image', 'chest.png', {}),
+    'start_menu': ('image', 'start_menu.jpg', {}),
+    'enemy/idle': ('entities', 'entities/enemy/idle', {'img_dur': 6}),
+    'enemy/run': ('entities', 'entities/enemy/run', {'img_dur': 4}),
+    'player/idle': ('entities', 'entities/player/idle', {'img_dur': 6}),
+    'player/run': ('entities', 'entities/player/run', {'img_dur': 4}),
+    'player/jump': ('entities', 'entities/player/jump', {}),
+    'player/slide': ('entities', 'entities/player/slide', {}),
+    'particle/leaf': ('particles', 'particles/leaf', {'img_dur': 20, 'loop': False}),
+    'particle/particle': ('particles', 'particles/particle', {'img_dur': 6, 'loop': False}),
+    'gun': ('image', 'gun.png', {}),
+    'projectile': ('image', 'projectile.png', {}),
+}
+
+# name: (path, volume, priority). Higher priorities may take the channel of
+# lower ones when every channel is busy.
+SOUNDS = {
+    'jump': ('ninja_data/sfx/jump.wav', 0.7, 1),
+    'dash': ('ninja_data/sfx/dash.wav', 0.3, 1),
+    'shoot': ('ninja_data/sfx/shoot.wav', 0.4, 2),
+    'hit': ('ninja_data/sfx/hit.wav', 0.8, 3),
+}
+
+# name: (path, volume). Long tracks streamed from disk rather than decoded up front
+STREAMS = {
+    'ambience': ('ninja_data/sfx/ambience.wav', 0.2),
+}
+
+# name: (path, volume). Played by pygame.mixer.music, which streams by itself
+MUSIC = {
+    'theme': ('ninja_data/music.wav', 0.5),
+}
+
+# atlas: (flipped frames, entries become Animations)
+ATLASES = {
+    'tiles': (False, False),
+    'entities': (True, True),
+    'particles': (False, True),
+}
+
+
+class ImageCache:
+    # Decoded and converted pixels stored on disk under a hash of the source
+    # file, so later launches skip PNG/JPEG decoding entirely.
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.preloaded = {}
+
+    def cache_path(self, data):
+        return os.path.join(self.path, hashlib.blake2b(data, digest_size=16).hexdigest() + '.raw')
+
+    def load(self, path):
+        if path in self.preloaded:
+            return self.preloaded.pop(path)
+        img, cache_path, hit = self.decode(path)
+        return self.finish(img, cache_path, hit)
+
+    def decode(self, path):
+        # Safe on worker threads: nothing here needs the display
+        with open(BASE_IMG_PATH + path, 'rb') as f:
+            data = f.read()
+        cache_path = self.cache_path(data)
+        img = self.read(cache_path)
+        if img is not None:
+            return img, cache_path, True
+        return pygame.image.load(io.BytesIO(data), path), cache_path, False
+
+    def finish(self, img, cache_path, hit, pool=None):
+        # Main thread only: conversion to the display format
+        img = img.convert()
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            pixels = pygame.image.tobytes(img, 'BGRA')
+            if pool:
+                pool.submit(self.write, cache_path, img.get_size(), pixels)
+            else:
+                self.write(cache_path, img.get_size(), pixels)
+        img.set_colorkey((0, 0, 0))
+        return img
+
+    def read(self, cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                size = struct.unpack('<II', f.read(8))
+                pixels = f.read()
+            return pygame.image.frombuffer(pixels, size, 'BGRA')
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def write(self, cache_path, size, pixels):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack('<II', *size))
+                f.write(pixels)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # The cache is only an optimisation
+
+
+class AssetManager:
+    # Mapping of asset name to surface/list/Animation that loads on first access.
+    # names picks (and orders) the assets an entry point uses, overrides swaps
+    # in different files for a name.
+    def __init__(self, names, overrides=None, cache=None):
+        self.specs = dict(ASSETS)
+        self.specs.update(overrides or {})
+        self.names = list(names)
+        self.cache = cache or ImageCache()
+        self.loaded = {}
+        self.atlases = {}
+        self.timings = {}
+        self.pending = {}  # path: decode job started by prefetch()
+        self.pool = None
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            if name not in self.names:
+                raise KeyError(name)
+            self.load(name)
+        return self.loaded[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def get(self, name, default=None):
+        return self[name] if name in self.names else default
+
+    def load(self, name):
+        loader, path, options = self.specs[name]
+        if loader == 'image':
+            self.loaded[name] = self.image(path)
+        else:
+            self.load_atlas(loader)
+
+    def load_atlas(self, atlas_name):
+        # Every requested asset of an atlas is packed together on first use
+        flipped, animated = ATLASES[atlas_name]
+        members = [name for name in self.names if self.specs[name][0] == atlas_name]
+        groups = {}
+        for name in members:
+            path = self.specs[name][1]
+            groups[path] = [self.image(path + '/' + img_name) for img_name in image_names(path)]
+        atlas = Atlas(groups, flipped=flipped)
+        self.atlases[atlas_name] = atlas
+
+        for name in members:
+            loader, path, options = self.specs[name]
+            if animated:
+                self.loaded[name] = atlas.animation(path, **options)
+            else:
+                self.loaded[name] = atlas.images[path]
+
+    def files(self, names):
+        paths = []
+        for name in names:
+            loader, path, options = self.specs[name]
+            if loader == 'image':
+                paths.append(path)
+            else:
+                paths.extend(path + '/' + img_name for img_name in image_names(path))
+        return paths
+
+    def preload(self, names=None, sounds=(), workers=None):
+        # Decodes image files and sounds on a thread pool; display conversion
+        # happens here on the calling thread as each decode finishes.
+        # Returns the loaded sounds and records per-asset timings.
+        paths = [path for path in self.files(self.names if names is None else names) if path not in self.cache.preloaded and path not in self.pending]
+        loaded_sounds = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sound_jobs = {name: pool.submit(timed, load_sound, SOUNDS[name]) for name in sounds}
+            image_jobs = {path: pool.submit(timed, self.cache.decode, path) for path in paths}
+            for path, job in image_jobs.items():
+                (img, cache_path, hit), duration = job.result()
+                start = time.perf_counter()
+                self.cache.preloaded[path] = self.cache.finish(img, cache_path, hit, pool=pool)
+                self.timings[path] = duration + time.perf_counter() - start
+            for name, job in sound_jobs.items():
+                loaded_sounds[name], self.timings[SOUNDS[name][0]] = job.result()
+        return loaded_sounds
+
+    def prefetch(self, names=None):
+        # Starts decoding the files of names (default: all not yet loaded) in
+        # the background and returns at once. The first access to an asset
+        # waits for its files and converts them on the calling thread.
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor()
+        names = [name for name in (self.names if names is None else names) if name not in self.loaded]
+        for path in self.files(names):
+            if path not in self.cache.preloaded and path not in self.pending:
+                self.pending[path] = self.pool.submit(timed, self.cache.decode, path)
+
+    def image(self, path):
+        job = self.pending.pop(path, None)
+        if job is None:
+            return self.cache.load(path)
+        (img, cache_path, hit), duration = job.result()
+        start = time.perf_counter()
+        img = self.cache.finish(img, cache_path, hit, pool=self.pool)
+        self.timings[path] = duration + time.perf_counter() - start
+        return img
+
+    def timing_report(self):
+        lines = [f'{duration * 1000:8.2f} ms  {path}' for path, duration in sorted(self.timings.items(), key=lambda t: -t[1])]
+        lines.append(f'{sum(self.timings.values()) * 1000:8.2f} ms  total across {len(self.timings)} assets')
+        return lines
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def load_sound(spec):
+    path, volume, priority = spec
+    sound = pygame.mixer.Sound(path)
+    sound.set_volume(volume)
+    return sound
+
+
+if __name__ == '__main__':
+    pygame.init()
+    pygame.display.set_mode((320, 240))
+    assets = AssetManager(ASSETS)
+    start = time.perf_counter()
+    assets.preload(sounds=SOUNDS)
+    print('\n'.join(assets.timing_report()))
+    print(f'{(time.perf_counter() - start) * 1000:8.2f} ms  wall clock')
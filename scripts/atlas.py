@@ -0,0 +1,80 @@
+import math
+
+import pygame
+
+from scripts.utils import load_images, Animation
+
+
+class Atlas:
+    # Packs groups of images into one sheet. images[name] holds subsurfaces of
+    # the sheet so existing code can keep treating them as plain surfaces,
+    # regions[name] holds the matching sub-rects.
+    def __init__(self, groups, padding=1, flipped=False, colorkey=(0, 0, 0)):
+        self.padding = padding
+        self.regions = {}
+        self.flipped_regions = {}
+
+        entries = []
+        for name, images in groups.items():
+            self.regions[name] = [None] * len(images)
+            if flipped:
+                self.flipped_regions[name] = [None] * len(images)
+            for i, img in enumerate(images):
+                entries.append((name, i, False, img))
+                if flipped:
+                    entries.append((name, i, True, img))
+
+        size = self.pack(entries)
+        self.sheet = pygame.Surface(size)
+        if pygame.display.get_surface():
+            self.sheet = self.sheet.convert()
+        self.sheet.fill(colorkey)
+        self.sheet.set_colorkey(colorkey)
+
+        for name, i, flip, img in entries:
+            rect = (self.flipped_regions if flip else self.regions)[name][i]
+            self.sheet.blit(pygame.transform.flip(img, True, False) if flip else img, rect)
+
+        self.images = {name: [self.sheet.subsurface(rect) for rect in rects] for name, rects in self.regions.items()}
+        self.flipped_images = {name: [self.sheet.subsurface(rect) for rect in rects] for name, rects in self.flipped_regions.items()}
+
+    def pack(self, entries):
+        # Shelf packing, tallest images first
+        area = sum((img.get_width() + self.padding) * (img.get_height() + self.padding) for _, _, _, img in entries)
+        width = max([int(math.sqrt(area)) + 1] + [img.get_width() + self.padding for _, _, _, img in entries])
+
+        x = y = shelf_height = 0
+        for name, i, flip, img in sorted(entries, key=lambda e: -e[3].get_height()):
+            w, h = img.get_width(), img.get_height()
+            if x + w > width:
+                x = 0
+                y += shelf_height + self.padding
+                shelf_height = 0
+            (self.flipped_regions if flip else self.regions)[name][i] = pygame.Rect(x, y, w, h)
+            x += w + self.padding
+            shelf_height = max(shelf_height, h)
+        return (width, max(1, y + shelf_height))
+
+    def animation(self, name, img_dur=5, loop=True):
+        return Animation(self.images[name], img_dur=img_dur, loop=loop, flipped=self.flipped_images.get(name))
+
+
+def load_atlas(paths, flipped=False):
+    return Atlas({path: load_images(path) for path in paths}, flipped=flipped)
+
+
+class RenderQueue:
+    # Collects the blits of a frame and submits them with a single Surface.blits call
+    def __init__(self):
+        self.draws = []
+
+    def add(self, source, dest, area=None):
+        if area:
+            self.draws.append((source, dest, area))
+        else:
+            self.draws.append((source, dest))
+
+    def flush(self, surf):
+        if self.draws:
+            surf.blits(self.draws, doreturn=False)
+            self.draws.clear()
@@ -0,0 +1,130 @@
+import wave
+import itertools
+
+import pygame
+
+from scripts.assets import SOUNDS, STREAMS, MUSIC
+
+
+class AudioStream:
+    # A long track played from disk a chunk at a time: one chunk plays while
+    # the next waits in the channel's queue, so only two chunks of PCM are
+    # ever decoded. Files the mixer can't take as-is are loaded whole.
+    def __init__(self, path, channel, volume=1, loop=True, chunk_seconds=0.5):
+        self.path = path
+        self.channel = channel
+        self.volume = volume
+        self.loop = loop
+        self.file = wave.open(path, 'rb')
+        frequency, size, channels = pygame.mixer.get_init()
+        params = self.file.getparams()
+        self.streaming = (params.framerate, params.sampwidth * 8, params.nchannels) == (frequency, abs(size), channels)
+        self.chunk_frames = int(params.framerate * chunk_seconds)
+        self.finished = False
+        if not self.streaming:
+            self.file.close()
+            sound = pygame.mixer.Sound(path)
+            sound.set_volume(volume)
+            channel.play(sound, loops=-1 if loop else 0)
+
+    def read(self):
+        data = self.file.readframes(self.chunk_frames)
+        if len(data) < self.chunk_frames * self.file.getsampwidth() * self.file.getnchannels() and self.loop:
+            self.file.rewind()
+            data += self.file.readframes(self.chunk_frames - len(data) // (self.file.getsampwidth() * self.file.getnchannels()))
+        if not data:
+            return None
+        sound = pygame.mixer.Sound(buffer=data)
+        sound.set_volume(self.volume)
+        return sound
+
+    def tick(self):
+        if not self.streaming or self.finished:
+            return
+        if not self.channel.get_busy():
+            chunk = self.read()
+            if chunk is None:
+                self.stop()
+                return
+            self.channel.play(chunk)
+        if self.channel.get_queue() is None:
+            chunk = self.read()
+            if chunk is not None:
+                self.channel.queue(chunk)
+
+    def stop(self):
+        self.channel.stop()
+        if self.streaming and not self.finished:
+            self.file.close()
+        self.finished = True
+
+
+class AudioManager:
+    # Sound effects share a fixed pool of mixer channels. When all are busy a
+    # new sound takes the voice of the lowest priority, oldest one, if that
+    # is no more important than itself; otherwise it is dropped. A sound
+    # triggered again in the same frame is played once. The first channels
+    # are reserved for streams.
+    def __init__(self, sounds, channels=8, streams=1):
+        self.sounds = sounds
+        self.priorities = {name: spec[2] for name, spec in SOUNDS.items()}
+        pygame.mixer.set_num_channels(channels + streams)
+        pygame.mixer.set_reserved(streams)
+        self.stream_channels = [pygame.mixer.Channel(i) for i in range(streams)]
+        self.pool = [pygame.mixer.Channel(i) for i in range(streams, streams + channels)]
+        self.voices = [(0, 0)] * channels  # (priority, serial) of what each pool channel last played
+        self.serial = itertools.count(1)
+        self.triggered = set()
+        self.streams = {}
+        self.dropped = 0  # Sounds that found no channel, for profiling
+
+    def play(self, name, loops=0):
+        if name in self.triggered:
+            return None
+        self.triggered.add(name)
+        priority = self.priorities[name]
+        index = self.voice(priority)
+        if index is None:
+            self.dropped += 1
+            return None
+        self.voices[index] = (priority, next(self.serial))
+        self.pool[index].play(self.sounds[name], loops=loops)
+        return self.pool[index]
+
+    def voice(self, priority):
+        # A free pool channel, else the one to steal, else None
+        steal = None
+        for index, channel in enumerate(self.pool):
+            if not channel.get_busy():
+                return index
+            if steal is None or self.voices[index] < self.voices[steal]:
+                steal = index
+        if self.voices[steal][0] <= priority:
+            return steal
+        return None
+
+    def stream(self, name, loop=True):
+        path, volume = STREAMS[name]
+        self.stop_stream(name)
+        channel = next((channel for channel in self.stream_channels if channel not in [stream.channel for stream in self.streams.values()]), None)
+        if channel is None:
+            return None
+        self.streams[name] = AudioStream(path, channel, volume, loop)
+        return self.streams[name]
+
+    def stop_stream(self, name):
+        if name in self.streams:
+            self.streams.pop(name).stop()
+
+    def music(self, name, loops=-1):
+        path, volume = MUSIC[name]
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops)
+
+    def end_frame(self):
+        self.triggered.clear()
+        for name, stream in list(self.streams.items()):
+            stream.tick()
+            if stream.finished:
+                del self.streams[name]
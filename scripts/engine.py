@@ -0,0 +1,485 @@
+import sys
+import math
+import time
+import random
+import argparse
+
+import pygame
+
+from scripts.assets import AssetManager, SOUNDS
+from scripts.audio import AudioManager
+from scripts.atlas import RenderQueue
+from scripts.entities import Player, Enemy
+from scripts.tilemap import Tilemap
+from scripts.levels import LevelLoader
+from scripts.sight import LineOfSight
+from scripts.loop import FixedStepLoop, lerp
+from scripts.profiler import FrameProfiler
+from scripts.present import Presenter
+from scripts.transition import IrisTransition
+from scripts.headless import init_headless, NullAudio
+
+CULL_MARGIN = 32  # Pixels around the camera still drawn, for sprites wider than their position
+
+
+class System:
+    __slots__ = ('name', 'func', 'states', 'order', 'budget', 'enabled', 'last_ms', 'overruns')
+
+    def __init__(self, name, func, states, order, budget):
+        self.name = name
+        self.func = func
+        self.states = states
+        self.order = order
+        self.budget = budget  # ms per run, or None for no timing
+        self.enabled = True
+        self.last_ms = 0
+        self.overruns = 0
+
+
+class Scheduler:
+    # Update and render are lists of named systems run in order. Each system
+    # only runs in the states it was registered for, so a menu frame never
+    # pays for the game's work.
+    def __init__(self, profiler=None):
+        self.profiler = profiler or FrameProfiler()
+        self.stages = {'update': [], 'render': []}
+        self.plans = {}
+
+    def add(self, stage, name, func, states=('game',), order=None, budget=None):
+        systems = self.stages[stage]
+        if order is None:
+            order = systems[-1].order + 1 if systems else 0
+        system = System(name, func, tuple(states), order, budget)
+        systems.append(system)
+        systems.sort(key=lambda system: system.order)
+        self.plans = {}
+        return system
+
+    def get(self, name):
+        for systems in self.stages.values():
+            for system in systems:
+                if system.name == name:
+                    return system
+        raise KeyError(name)
+
+    def enable(self, name, enabled=True):
+        self.get(name).enabled = enabled
+        self.plans = {}
+
+    def plan(self, stage, state):
+        # Filtered once per stage/state and reused until systems change
+        key = (stage, state)
+        if key not in self.plans:
+            self.plans[key] = [system for system in self.stages[stage] if system.enabled and state in system.states]
+        return self.plans[key]
+
+    def run(self, stage, state):
+        scope = self.profiler.scope
+        for system in self.plan(stage, state):
+            if system.budget is None:
+                with scope(system.name):
+                    system.func()
+            else:
+                start = time.perf_counter()
+                with scope(system.name):
+                    system.func()
+                system.last_ms = (time.perf_counter() - start) * 1000
+                if system.last_ms > system.budget:
+                    system.overruns += 1
+
+    def overruns(self):
+        return {system.name: system.overruns for systems in self.stages.values() for system in systems if system.overruns}
+
+
+class Engine:
+    # The shared core of cave.py and map.py. Subclasses set the class
+    # attributes below and register their own systems in setup().
+    caption = 'pypypy in cave game'
+    screen_size = (640, 480)
+    asset_names = []
+    startup_assets = ()  # Needed before the first frame; the rest decode in the background
+    asset_overrides = None
+    player_start = (50, 50)
+    move_speed = 1
+    step_states = ('game',)  # States that run on the fixed simulation step
+
+    def __init__(self, headless=False, events=None, seed=None):
+        # Headless runs use SDL's dummy drivers and never touch the mixer
+        self.startup = {}  # Seconds per startup phase, see startup_report()
+        self.last_mark = time.perf_counter()
+        self.headless = headless
+        self.rng = random.Random(seed)  # All simulation randomness, so seeded runs repeat exactly
+        if headless:
+            init_headless()
+        else:
+            pygame.init()
+        self.events = events or pygame.event  # Anything with a get() returning events
+
+        pygame.display.set_caption(self.caption)
+        self.screen = pygame.display.set_mode(self.screen_size)
+        self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
+        self.display_2 = pygame.Surface((320, 240))
+        self.presenter = Presenter(self.screen, self.display_2.get_size())
+        self.iris = IrisTransition(self.display.get_size())
+
+        self.clock = pygame.time.Clock()
+        self.max_fps = 120  # Rendering cap; the simulation always steps at loop.rate
+        self.loop = FixedStepLoop(rate=60)
+        self.profiler = FrameProfiler()  # F3 toggles the overlay, F4 exports profile.csv/json
+        self.systems = Scheduler(self.profiler)
+
+        self.movement_x = [False, False]
+        self.movement_y = [False, False]
+        self.font = pygame.font.Font(None, 23)
+        self.render_queue = RenderQueue()
+        self.mark('display')
+
+        # Shared lazily loaded assets; each atlas group is packed on first use
+        self.assets = AssetManager(self.asset_names, overrides=self.asset_overrides)
+
+        # What the first frame needs and the sound effects are decoded in
+        # parallel up front; long tracks are streamed by the audio manager
+        if headless:
+            self.assets.preload(self.startup_assets)
+            self.audio = NullAudio()
+        else:
+            self.audio = AudioManager(self.assets.preload(self.startup_assets, sounds=SOUNDS))
+        self.assets.prefetch()
+        self.mark('assets')
+
+        self.player = Player(self, self.player_start, (8, 15))
+
+        self.tilemap = Tilemap(self, tile_size=16)
+        self.sight = LineOfSight(self.tilemap)
+
+        self.level = 0
+        self.levels = LevelLoader()
+
+        self.load_level(0)
+        self.mark('level')
+
+        self.screenshake = 0
+        self.state = "menu"
+        self.alpha = 1
+        self.render_scroll = (0, 0)
+        self.camera = pygame.Rect(0, 0, *self.display.get_size())
+        self.visible_enemies = []
+        self.visible_particles = []
+        self.visible_sparks = []
+        self.dirty = None
+        self.menu = None  # The start menu's HUD, made by setup()
+
+        self.setup()
+        self.systems.add('render', 'profiler', self.draw_profiler, order=1000)
+        self.mark('setup')
+
+    def setup(self):
+        pass
+
+    def mark(self, phase):
+        # Time since the previous mark is put down to phase
+        now = time.perf_counter()
+        self.startup[phase] = self.startup.get(phase, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def startup_report(self, top=5):
+        lines = [f'{seconds * 1000:8.1f} ms  {phase}' for phase, seconds in self.startup.items()]
+        lines.append(f'{sum(self.startup.values()) * 1000:8.1f} ms  to the first frame')
+        lines.append('slowest assets:')
+        lines.extend('  ' + line for line in self.assets.timing_report()[:top])
+        return lines
+
+    def add_menu_systems(self):
+        # The start menu: Enter starts the game, Q quits
+        add = self.systems.add
+        add('update', 'menu input', self.menu_input, states=('menu',))
+        add('render', 'draw menu', self.draw_menu, states=('menu',))
+
+    def add_game_systems(self):
+        # The simulation and drawing both games share, in their original order
+        # Orders are spaced by ten so games can slot their own systems in between
+        add = self.systems.add
+        add('update', 'begin step', self.begin_step, order=10)
+        add('update', 'scroll', self.update_scroll, order=20)
+        add('update', 'enemies', self.update_enemies, order=30)
+        add('update', 'player', self.update_player, order=40)
+        add('update', 'sparks', self.update_sparks, order=50)
+        add('update', 'particles', self.update_particles, order=60)
+        add('update', 'events', self.handle_events, order=70)
+
+        add('render', 'clear', self.clear, order=10)
+        add('render', 'cull', self.cull, order=15)
+        add('render', 'draw tiles', self.draw_tiles, order=20)
+        add('render', 'draw entities', self.draw_entities, order=30)
+        add('render', 'draw sparks', self.draw_sparks, order=40)
+        add('render', 'silhouette', self.draw_silhouette, order=50, budget=4)
+        add('render', 'draw particles', self.draw_particles, order=60)
+        add('render', 'transition', self.draw_transition, order=70)
+        add('render', 'upscale', self.upscale, order=80, budget=8)
+
+    def load_level(self, map_id):
+        # Built from the cached template: no disk access, tile data is shared
+        level = self.levels.get(map_id)
+        self.tilemap.share(level.tilemap, level.offgrid_tiles, level.tile_size)
+
+        self.leaf_spawners = level.leaf_spawner_rects()
+
+        if level.player_pos:
+            self.player.place(level.player_pos)
+        self.enemies = [Enemy(self, pos, (8, 15)) for pos in level.enemy_positions]
+
+        self.projectiles = []
+        self.particles = []
+        self.sparks = []
+
+        self.scroll = [0, 0]
+        self.prev_scroll = [0, 0]
+        self.dead = 0
+        self.transition = -30
+
+        self.level_loaded(level)
+
+        # Get the following level ready while this one is played
+        self.levels.prefetch(self.levels.next_level(map_id))
+
+    def level_loaded(self, level):
+        pass
+
+    def reset(self, seed=None, map_id=0):
+        # Fresh run of one level, e.g. for reproducible simulations
+        self.rng.seed(seed)
+        self.player = Player(self, self.player_start, (8, 15))
+        self.movement_x = [False, False]
+        self.movement_y = [False, False]
+        self.level = map_id
+        self.load_level(map_id)
+        self.screenshake = 0
+        self.state = "game"
+
+    def quit(self):
+        pygame.quit()
+        sys.exit()
+
+    def run(self):
+        self.audio.music('theme')
+        self.audio.stream('ambience')
+
+        while True:
+            self.frame()
+            self.clock.tick(self.max_fps)
+
+    def frame(self):
+        state = self.state
+        if state in self.step_states:
+            # Zero or more fixed steps, then one render between the last two
+            steps, alpha = self.loop.advance()
+            for _ in range(steps):
+                self.update()
+                if self.state != state:
+                    break
+        else:
+            # Menus tick once per frame and their time isn't simulated
+            self.loop.reset()
+            self.update()
+            alpha = 1
+
+        if self.state != state:
+            self.state_changed(state)
+
+        dirty = self.render(alpha)
+        if dirty is None:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
+        self.audio.end_frame()
+
+    def state_changed(self, previous):
+        if previous == "game":
+            # Menus repaint themselves from scratch when shown again
+            self.menu.invalidate()
+
+    def update(self):
+        self.systems.run('update', self.state)
+
+    def render(self, alpha=1):
+        # Systems add the screen rects they touched; None means the whole screen
+        self.alpha = alpha
+        self.dirty = []
+        self.systems.run('render', self.state)
+        self.profiler.end_frame(enemies=len(self.enemies), particles=len(self.particles), sparks=len(self.sparks))
+        return self.dirty
+
+    # Update systems
+
+    def begin_step(self):
+        self.prev_scroll[0] = self.scroll[0]
+        self.prev_scroll[1] = self.scroll[1]
+        self.screenshake = max(0, self.screenshake - 1)
+
+    def update_scroll(self):
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
+
+    def update_enemies(self):
+        # One batched line-of-sight query for the enemies close enough to chase
+        near = [enemy for enemy in self.enemies if math.dist(enemy.pos, self.player.pos) < enemy.detection_radius]
+        for enemy, seen in zip(near, self.sight.visible([enemy.rect().center for enemy in near], self.player.rect().center)):
+            enemy.sees_player = seen
+
+        for enemy in self.enemies.copy():
+            kill = enemy.update(self.tilemap, (0, 0))
+            if kill:
+                self.enemies.remove(enemy)
+                self.enemy_killed(enemy)
+
+    def enemy_killed(self, enemy):
+        pass
+
+    def update_player(self):
+        if not self.dead:
+            self.player.update(self.tilemap, ((self.movement_x[1] - self.movement_x[0]) * self.move_speed, (self.movement_y[1] - self.movement_y[0]) * self.move_speed))
+
+    def update_sparks(self):
+        for spark in self.sparks.copy():
+            kill = spark.update()
+            if kill:
+                self.sparks.remove(spark)
+
+    def update_particles(self):
+        for particle in self.particles.copy():
+            kill = particle.update()
+            if particle.type == 'leaf':
+                particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
+            if kill:
+                self.particles.remove(particle)
+
+    def handle_events(self):
+        for event in self.events.get():
+            if event.type == pygame.QUIT:
+                self.quit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_b:
+                    sys.exit()
+                if event.key == pygame.K_a:
+                    self.movement_x[0] = True
+                if event.key == pygame.K_d:
+                    self.movement_x[1] = True
+                if event.key == pygame.K_w:
+                    self.movement_y[0] = True
+                if event.key == pygame.K_s:
+                    self.movement_y[1] = True
+                if event.key == pygame.K_x:
+                    self.player.dash()
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle()
+                if event.key == pygame.K_F4:
+                    self.profiler.export_csv('profile.csv')
+                    self.profiler.export_chrome_trace('profile.json')
+                self.key_down(event.key)
+
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_a:
+                    self.movement_x[0] = False
+                if event.key == pygame.K_d:
+                    self.movement_x[1] = False
+                if event.key == pygame.K_w:
+                    self.movement_y[0] = False
+                if event.key == pygame.K_s:
+                    self.movement_y[1] = False
+
+    def key_down(self, key):
+        # Game specific keys, after the shared ones
+        pass
+
+    def menu_input(self):
+        for event in self.events.get():
+            if event.type == pygame.QUIT:
+                self.quit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:  # Start game when Enter is pressed
+                    self.state = "game"
+                if event.key == pygame.K_q:  # Quit game
+                    self.quit()
+
+    # Render systems
+
+    def draw_menu(self):
+        # Only the first menu frame (or a changed widget) touches the screen
+        self.dirty += self.menu.draw(self.screen)
+
+    def clear(self):
+        self.display.fill((0, 0, 0, 0))
+        self.display_2.blit(self.assets['background'], (0, 0))
+        self.render_scroll = (int(lerp(self.prev_scroll[0], self.scroll[0], self.alpha)), int(lerp(self.prev_scroll[1], self.scroll[1], self.alpha)))
+
+    def cull(self):
+        # What overlaps the camera, padded for sprites that reach past their
+        # position; the draw systems only see these
+        self.camera = pygame.Rect(self.render_scroll, self.display.get_size())
+        view = self.camera.inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+        left, top, right, bottom = view.left, view.top, view.right, view.bottom
+        self.visible_enemies = [enemy for enemy in self.enemies if left <= enemy.pos[0] < right and top <= enemy.pos[1] < bottom]
+        self.visible_particles = [particle for particle in self.particles if left <= particle.pos[0] < right and top <= particle.pos[1] < bottom]
+        self.visible_sparks = [spark for spark in self.sparks if left <= spark.pos[0] < right and top <= spark.pos[1] < bottom]
+
+    def draw_tiles(self):
+        self.tilemap.render(self.display, offset=self.render_scroll, queue=self.render_queue)
+
+    def draw_entities(self):
+        for enemy in self.visible_enemies:
+            enemy.render(self.display, offset=self.render_scroll, queue=self.render_queue, alpha=self.alpha)
+
+        if not self.dead:
+            self.player.render(self.display, offset=self.render_scroll, queue=self.render_queue, alpha=self.alpha)
+
+        self.render_queue.flush(self.display)
+
+    def draw_sparks(self):
+        for spark in self.visible_sparks:
+            spark.render(self.display, offset=self.render_scroll)
+
+    def draw_silhouette(self):
+        display_mask = pygame.mask.from_surface(self.display)
+        display_sillhouette = display_mask.to_surface(setcolor=(0,0,0,180), unsetcolor=(0,0,0,0))
+
+        for offset in [(-1,0), (1,0), (0,1), (0,-1)]:
+            self.display_2.blit(display_sillhouette, offset)
+
+    def draw_particles(self):
+        for particle in self.visible_particles:
+            particle.render(self.display, offset=self.render_scroll, queue=self.render_queue)
+        self.render_queue.flush(self.display)
+
+    def draw_transition(self):
+        if self.transition:
+            self.iris.render(self.display, self.transition)
+
+    def upscale(self):
+        self.display_2.blit(self.display, (0, 0))
+
+        screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
+        self.presenter.present(self.display_2, screenshake_offset)
+        self.dirty = None
+
+    def draw_profiler(self):
+        self.profiler.render_overlay(self.screen, self.font)
+
+
+def main(game_cls, argv=None, import_start=None):
+    # Command line entry point of the games. import_start is when the entry
+    # module began importing, so the report can include it.
+    parser = argparse.ArgumentParser(description=game_cls.caption)
+    parser.add_argument('--headless', action='store_true', help="use SDL's dummy drivers")
+    parser.add_argument('--startup', action='store_true', help='report where the time to the first frame went, then quit')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    game = game_cls(headless=args.headless)
+    if not args.startup:
+        game.run()
+        return
+    game.frame()
+    game.mark('first frame')
+    if import_start is not None:
+        game.startup = {'import': start - import_start, **game.startup}
+    print('\n'.join(game.startup_report()))
@@ -1,14 +1,25 @@
-import pygame
-from scripts.particle import Particle
 import math
-import random
-from scripts.spark import Spark
+from scripts.loop import lerp
+
+# Render-side classes, imported on first use so tools can load the game
+# logic without pygame
+Rect = None
+Particle = None
+
+
+def new_particle(*args, **kwargs):
+    global Particle
+    if Particle is None:
+        from scripts.particle import Particle
+    return Particle(*args, **kwargs)
+
 
 class PhysicsEntity:
     def __init__(self, game, e_type, pos, size):
         self.game = game
         self.type = e_type
         self.pos = list(pos)  # [x, y] position
+        self.prev_pos = list(pos)  # Position before the last update, for interpolated rendering
         self.size = size  # [width, height]
         self.velocity = [0, 0]  # [x_velocity, y_velocity]
         self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
@@ -20,7 +31,15 @@ class PhysicsEntity:
         self.last_movement = [0, 0]
 
     def rect(self):
-        return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+        global Rect
+        if Rect is None:
+            from pygame import Rect
+        return Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+
+    def place(self, pos):
+        # Moves without interpolating from the old position
+        self.pos = list(pos)
+        self.prev_pos = list(pos)
         
     def set_action(self, action):
         if action != self.action:
@@ -29,39 +48,23 @@ class PhysicsEntity:
 
     def update(self, tilemap, movement=(0, 0)):
         self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
+        self.prev_pos[0] = self.pos[0]
+        self.prev_pos[1] = self.pos[1]
 
         # Movement is now fully controlled in both x and y axes
         frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])
 
-        # Update x-axis position
-        self.pos[0] += frame_movement[0]
-        entity_rect = self.rect()
-
-        # Handle horizontal collisions
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:
-                    entity_rect.right = rect.left
-                    self.collisions['right'] = True
-                if frame_movement[0] < 0:
-                    entity_rect.left = rect.right
-                    self.collisions['left'] = True
-                self.pos[0] = entity_rect.x
-
-        # Update y-axis position
-        self.pos[1] += frame_movement[1]
-        entity_rect = self.rect()
-
-        # Handle vertical collisions
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
-                self.pos[1] = entity_rect.y
+        # Each axis is swept through the grid, so fast moves (dashes,
+        # knockback) stop at the first wall instead of passing through it
+        moved, _, normal = tilemap.sweep(self.pos, self.size, 0, frame_movement[0])
+        self.pos[0] += moved
+        if normal:
+            self.collisions['right' if normal[0] < 0 else 'left'] = True
+
+        moved, _, normal = tilemap.sweep(self.pos, self.size, 1, frame_movement[1])
+        self.pos[1] += moved
+        if normal:
+            self.collisions['down' if normal[1] < 0 else 'up'] = True
 
         # Set flip direction based on horizontal movement
         if movement[0] > 0:
@@ -74,11 +77,15 @@ class PhysicsEntity:
         # No gravity, so velocity[1] is not affected anymore
         self.animation.update()
 
-    def render(self, surf, offset=(0, 0)):
-        surf.blit(
-            pygame.transform.flip(self.animation.img(), self.flip, False),
-            (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1])
-        )
+    def render(self, surf, offset=(0, 0), queue=None, alpha=1):
+        img = self.animation.img(self.flip)
+        x = lerp(self.prev_pos[0], self.pos[0], alpha)
+        y = lerp(self.prev_pos[1], self.pos[1], alpha)
+        pos = (x - offset[0] + self.anim_offset[0], y - offset[1] + self.anim_offset[1])
+        if queue:
+            queue.add(img, pos)
+        else:
+            surf.blit(img, pos)
 
 
 class Enemy(PhysicsEntity):
@@ -86,6 +93,7 @@ class Enemy(PhysicsEntity):
         super().__init__(game, 'enemy', pos, size)
         self.walking = 0
         self.detection_radius = 100  # Distance within which enemy detects and follows player
+        self.sees_player = True  # Set each step by the game's line-of-sight query
         self.attack_range = 20  # Distance within which the enemy deals melee damage
         self.attack_damage = 10  # Damage dealt to the player on hit
         self.attack_cooldown = 0  # Cooldown time between attacks
@@ -101,7 +109,7 @@ class Enemy(PhysicsEntity):
 
         # Follow the player horizontally and vertically
         if not self.game.player.dashing:
-            if distance_to_player < self.detection_radius:
+            if distance_to_player < self.detection_radius and self.sees_player:
                 if abs(player_distance_x) > self.attack_range:
                     if player_distance_x > 0:
                         movement = (0.7, movement[1])
@@ -118,8 +126,8 @@ class Enemy(PhysicsEntity):
         # Add noise when enemy hits a wall to prevent sticking
         if self.collisions['left'] or self.collisions['right'] or self.collisions['up'] or self.collisions['down']:
             # Add small random noise to x and y movement to unstuck
-            noise_x = random.uniform(-self.noise_factor, self.noise_factor)
-            noise_y = random.uniform(-self.noise_factor, self.noise_factor)
+            noise_x = self.game.rng.uniform(-self.noise_factor, self.noise_factor)
+            noise_y = self.game.rng.uniform(-self.noise_factor, self.noise_factor)
             movement = (movement[0] + noise_x, movement[1] + noise_y)
 
         player_pos = self.game.player.pos
@@ -201,10 +209,10 @@ class Player(PhysicsEntity):
         # Dashing logic
         if abs(self.dashing) in {60, 50}:
             for i in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+                self.game.particles.append(new_particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7)))
 
         if self.dashing > 0:
             self.dashing = max(self.dashing - 1, 0)
@@ -214,8 +222,8 @@ class Player(PhysicsEntity):
             self.velocity[0] = abs(self.dashing) / self.dashing * 8
             if abs(self.dashing) == 51:
                 self.velocity[0] *= 0.1
-            pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+            pvelocity = [abs(self.dashing) / self.dashing * self.game.rng.random() * 3, 0]
+            self.game.particles.append(new_particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7)))
 
         # Reduce horizontal velocity over time
         if self.velocity[0] > 0:
@@ -228,13 +236,13 @@ class Player(PhysicsEntity):
             self.velocity[1] = max(self.velocity[1] - 0.1, 0)
         else:
             self.velocity[1] = min(self.velocity[1] + 0.1, 0)
-    def render(self, surf, offset=(0, 0)):
+    def render(self, surf, offset=(0, 0), queue=None, alpha=1):
         if abs(self.dashing) <= 50:
-            super().render(surf, offset=offset)
+            super().render(surf, offset=offset, queue=queue, alpha=alpha)
 
     def dash(self):
         if not self.dashing:
-            self.game.sfx['dash'].play()
+            self.game.audio.play('dash')
             if self.flip:
                 self.dashing = -60
             else:
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import random
+import argparse
+import importlib
+
+from scripts.tilemap import AUTOTILE_MAP, AUTOTILE_SHIFTS
+
+GENERATED_PATH = '.cache/generated/'
+DECOR_VARIANTS = 4
+LARGE_DECOR_VARIANTS = 3
+
+
+def lattice(x, y, seed):
+    # Hashes a lattice point to [0, 1)
+    h = (x * 374761393 + y * 668265263 + seed * 2147483647) & 0xffffffff
+    h = ((h ^ (h >> 13)) * 1274126177) & 0xffffffff
+    return (h ^ (h >> 16)) / 4294967296
+
+
+def noise_row(y, width, seed, scale):
+    # Smoothed value noise along one row; needs no state from other rows
+    cell_y, fy = divmod(y, scale)
+    ty = fy / scale
+    ty = ty * ty * (3 - 2 * ty)
+    row = []
+    left_top = lattice(0, cell_y, seed)
+    left_bottom = lattice(0, cell_y + 1, seed)
+    for cell_x in range(width // scale + 1):
+        right_top = lattice(cell_x + 1, cell_y, seed)
+        right_bottom = lattice(cell_x + 1, cell_y + 1, seed)
+        left = left_top + (left_bottom - left_top) * ty
+        right = right_top + (right_bottom - right_top) * ty
+        for fx in range(min(scale, width - cell_x * scale)):
+            tx = fx / scale
+            tx = tx * tx * (3 - 2 * tx)
+            row.append(left + (right - left) * tx)
+        left_top, left_bottom = right_top, right_bottom
+    return row
+
+
+class LevelGenerator:
+    # Writes a cave level in the game's map schema one row at a time, so
+    # memory stays at a few rows however large the level is.
+    def __init__(self, width, height, density=0.45, decor=0.03, enemies=20, seed=0, scale=12):
+        self.width = width
+        self.height = height
+        self.density = density  # Roughly the share of solid tiles
+        self.decor = decor  # Chance an open tile gets decor
+        self.enemies = enemies
+        self.seed = seed
+        self.scale = scale  # Cave feature size in tiles
+        self.rng = random.Random(seed)
+
+        # Cells kept open for the spawners, drawn up front so rows can be streamed
+        self.player = (width // 2, height // 2)
+        self.spawners = {self.player: 0}
+        for _ in range(enemies):
+            self.spawners[(self.rng.randrange(2, width - 2), self.rng.randrange(2, height - 2))] = 1
+        self.open_cells = set()
+        for x, y in self.spawners:
+            radius = 3 if (x, y) == self.player else 1
+            for dy in range(-radius, radius + 1):
+                for dx in range(-radius, radius + 1):
+                    self.open_cells.add((x + dx, y + dy))
+        self.tiles = 0
+
+    def solid_row(self, y):
+        if y < 0 or y >= self.height:
+            return [False] * self.width
+        if y == 0 or y == self.height - 1:
+            return [True] * self.width
+        coarse = noise_row(y, self.width, self.seed, self.scale)
+        fine = noise_row(y, self.width, self.seed + 1, max(2, self.scale // 3))
+        threshold = self.density
+        row = [coarse[x] * 0.75 + fine[x] * 0.25 < threshold for x in range(self.width)]
+        row[0] = row[-1] = True
+        for x, cell_y in self.open_cells:
+            if cell_y == y and 0 < x < self.width - 1:
+                row[x] = False
+        return row
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        offgrid = []
+        with open(path, 'w') as f:
+            f.write('{"tilemap": {')
+            first = True
+            above, row, below = self.solid_row(-1), self.solid_row(0), self.solid_row(1)
+            for y in range(self.height):
+                entries = []
+                for x in range(self.width):
+                    if row[x]:
+                        # Same variant choice as Tilemap.autotile, from the three rows in hand
+                        neighbors = []
+                        for shift_x, shift_y in AUTOTILE_SHIFTS:
+                            nx = x + shift_x
+                            if 0 <= nx < self.width and (above, row, below)[shift_y + 1][nx]:
+                                neighbors.append((shift_x, shift_y))
+                        entries.append(f'"{x};{y}": {{"type": "grass", "variant": {AUTOTILE_MAP.get(tuple(neighbors), 0)}, "pos": [{x}, {y}]}}')
+                    elif (x, y) in self.spawners:
+                        entries.append(f'"{x};{y}": {{"type": "spawners", "variant": {self.spawners[(x, y)]}, "pos": [{x}, {y}]}}')
+                    else:
+                        roll = lattice(x, y, self.seed + 2)
+                        if roll < self.decor:
+                            entries.append(f'"{x};{y}": {{"type": "decor", "variant": {int(roll / self.decor * DECOR_VARIANTS)}, "pos": [{x}, {y}]}}')
+                        elif roll < self.decor * 1.125:
+                            offgrid.append(f'{{"type": "large_decor", "variant": {int(x + y) % LARGE_DECOR_VARIANTS}, "pos": [{x * 16}, {y * 16}]}}')
+                if entries:
+                    f.write((', ' if not first else '') + ', '.join(entries))
+                    first = False
+                    self.tiles += len(entries)
+                above, row, below = row, below, self.solid_row(y + 2)
+            f.write('}, "tile_size": 16, "offgrid": [')
+            f.write(', '.join(offgrid))
+            f.write(']}')
+        return self.tiles
+
+
+def benchmark(sizes, enemy_counts, frames=300, game_module='cave', seed=0):
+    # Generates one level per scenario and plays it headless with the
+    # profiler on, reporting load time and the costliest systems
+    from scripts.headless import demo_input
+    from scripts.levels import LevelLoader
+
+    game = importlib.import_module(game_module).Game(headless=True)
+    results = []
+    for size in sizes:
+        for enemies in enemy_counts:
+            path = f'{GENERATED_PATH}{size}x{enemies}/'
+            start = time.perf_counter()
+            tiles = LevelGenerator(size, size, enemies=enemies, seed=seed).write(path + '0.json')
+            generate_time = time.perf_counter() - start
+
+            # Its own directory, so prefetching the "next" level is a no-op
+            game.levels = LevelLoader(path)
+            start = time.perf_counter()
+            game.reset(seed=seed, map_id=0)
+            load_time = time.perf_counter() - start
+            game.events = demo_input()
+            game.profiler.frames.clear()
+            game.profiler.enabled = True
+            game.profiler.frame_start = time.perf_counter()
+
+            start = time.perf_counter()
+            for _ in range(frames):
+                game.update()
+                game.render()
+            elapsed = time.perf_counter() - start
+            game.profiler.enabled = False
+
+            frame_ms, stages, counts = game.profiler.averages(frames)
+            results.append({
+                'size': size,
+                'enemies': enemies,
+                'tiles': tiles,
+                'spawned': counts.get('enemies', 0),
+                'generate_s': generate_time,
+                'load_ms': load_time * 1000,
+                'frame_ms': elapsed / frames * 1000,
+                'stages': stages,
+            })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate large cave levels and benchmark the game on them')
+    commands = parser.add_subparsers(dest='command', required=True)
+    map_args = commands.add_parser('map')
+    map_args.add_argument('path')
+    map_args.add_argument('--size', type=int, nargs=2, default=(1000, 1000), metavar=('WIDTH', 'HEIGHT'))
+    map_args.add_argument('--density', type=float, default=0.45)
+    map_args.add_argument('--decor', type=float, default=0.03)
+    map_args.add_argument('--enemies', type=int, default=20)
+    map_args.add_argument('--seed', type=int, default=0)
+    bench_args = commands.add_parser('bench')
+    bench_args.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024])
+    bench_args.add_argument('--enemies', type=int, nargs='+', default=[10, 100, 1000])
+    bench_args.add_argument('--frames', type=int, default=300)
+    bench_args.add_argument('--game', default='cave')
+    args = parser.parse_args()
+
+    if args.command == 'map':
+        if max(args.size) > 10000:
+            sys.exit('levels are limited to 10000 x 10000 tiles')
+        start = time.perf_counter()
+        tiles = LevelGenerator(args.size[0], args.size[1], args.density, args.decor, args.enemies, args.seed).write(args.path)
+        print(f'{args.path}: {tiles} tiles in {time.perf_counter() - start:.1f}s')
+    else:
+        for result in benchmark(args.sizes, args.enemies, args.frames, args.game):
+            top = sorted(result['stages'].items(), key=lambda stage: -stage[1])[:4]
+            print(f"{result['size']:>5}^2 {result['enemies']:>5} spawners ({result['spawned']:.0f} alive) {result['tiles']:>9} tiles: "
+                  f"generate {result['generate_s']:.1f}s, load {result['load_ms']:.0f} ms, frame {result['frame_ms']:.2f} ms | "
+                  + ', '.join(f'{name} {ms:.2f}' for name, ms in top))
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import importlib
+
+import pygame
+
+KEYS = {'left': pygame.K_a, 'right': pygame.K_d, 'up': pygame.K_w, 'down': pygame.K_s, 'dash': pygame.K_x}
+
+
+def init_headless():
+    # Must run before the display is initialised for SDL to pick these up
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.display.init()
+    pygame.font.init()
+
+
+class NullAudio:
+    # Stands in for AudioManager when there is no mixer
+    def play(self, name, loops=0):
+        return None
+
+    def stream(self, name, loop=True):
+        return None
+
+    def stop_stream(self, name):
+        pass
+
+    def music(self, name, loops=-1):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class ScriptedInput:
+    # Stands in for pygame.event: get() returns the events scripted for the
+    # current frame and advances to the next one.
+    def __init__(self, script=None):
+        self.script = script or {}
+        self.frame = 0
+
+    def press(self, key, frame, release=None):
+        self.script.setdefault(frame, []).append((pygame.KEYDOWN, KEYS.get(key, key)))
+        if release is not None:
+            self.script.setdefault(release, []).append((pygame.KEYUP, KEYS.get(key, key)))
+        return self
+
+    def get(self):
+        pygame.event.pump()
+        events = [pygame.event.Event(e_type, key=key) for e_type, key in self.script.get(self.frame, ())]
+        self.frame += 1
+        return events
+
+
+def run_headless(game_cls, frames=600, events=None, level=0, render=True):
+    # Runs the game loop unthrottled, timing simulation and rendering apart
+    game = game_cls(headless=True, events=events or ScriptedInput())
+    if level:
+        game.level = level
+        game.load_level(level)
+    game.state = 'game'
+
+    sim_time = 0
+    render_time = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        game.update()
+        sim_end = time.perf_counter()
+        if render:
+            game.render()
+            pygame.display.update()
+        sim_time += sim_end - start
+        render_time += time.perf_counter() - sim_end
+
+    return {
+        'frames': frames,
+        'sim_fps': frames / sim_time if sim_time else 0,
+        'render_fps': frames / render_time if render_time else 0,
+        'fps': frames / (sim_time + render_time) if sim_time + render_time else 0,
+        'overruns': game.systems.overruns(),  # Systems that went over their frame budget
+    }
+
+
+def start_from_menu(game_cls, frames=120):
+    # Presses Enter on the start menu and runs whole frames through the
+    # menu -> game switch, the way a player gets there. Returns the state.
+    game = game_cls(headless=True, events=ScriptedInput().press(pygame.K_RETURN, 2))
+    for _ in range(frames):
+        game.frame()
+    return game.state
+
+
+def demo_input():
+    # Walk right, then left, dashing now and then
+    script = ScriptedInput()
+    for start in range(0, 3600, 240):
+        script.press('right', start, start + 110)
+        script.press('left', start + 120, start + 230)
+        script.press('dash', start + 60, start + 61)
+    return script
+
+
+if __name__ == '__main__':
+    game_module = sys.argv[1] if len(sys.argv) > 1 else 'cave'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    state = start_from_menu(importlib.import_module(game_module).Game)
+    if state != 'game':
+        sys.exit(f'{game_module}: pressing Enter on the start menu left the game in state {state!r}')
+    result = run_headless(importlib.import_module(game_module).Game, frames=frames, events=demo_input())
+    print(f"{game_module}: {result['frames']} frames, sim {result['sim_fps']:.1f} fps, render {result['render_fps']:.1f} fps, total {result['fps']:.1f} fps")
+    for name, count in result['overruns'].items():
+        print(f'  {name} over budget in {count} frames')
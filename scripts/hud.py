@@ -0,0 +1,136 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, colour), least recently used
+    # entries are dropped once the cache is full.
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = font.render(text, antialias, color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surf
+
+
+class Widget:
+    def __init__(self, pos):
+        self.pos = pos
+        self.value = None
+        self.surf = None
+        self.rect = pygame.Rect(pos, (0, 0))
+        self.drawn_rect = self.rect
+        self.dirty = True
+
+    def set(self, value):
+        if value != self.value or self.surf is None:
+            self.value = value
+            self.surf = self.build(value)
+            self.rect = self.surf.get_rect(topleft=self.pos)
+            self.dirty = True
+
+    def build(self, value):
+        raise NotImplementedError
+
+
+class Label(Widget):
+    def __init__(self, cache, font, color, pos, fmt='{}', value=None):
+        super().__init__(pos)
+        self.cache = cache
+        self.font = font
+        self.color = color
+        self.fmt = fmt
+        if value is not None:
+            self.set(value)
+
+    def build(self, value):
+        return self.cache.render(self.font, self.fmt.format(value), self.color)
+
+
+class Bar(Widget):
+    def __init__(self, pos, size, color, border_color=(0, 0, 0), border=2):
+        super().__init__(pos)
+        self.size = size
+        self.color = color
+        self.border_color = border_color
+        self.border = border
+
+    def set(self, value):
+        # Only a change in filled pixels is worth a redraw.
+        super().set(int(self.size[0] * max(0, min(1, value))))
+
+    def build(self, filled):
+        surf = pygame.Surface(self.size, pygame.SRCALPHA)
+        pygame.draw.rect(surf, self.color, (0, 0, filled, self.size[1]))
+        pygame.draw.rect(surf, self.border_color, (0, 0, self.size[0], self.size[1]), self.border)
+        return surf
+
+
+class Image(Widget):
+    def __init__(self, pos, surf):
+        super().__init__(pos)
+        self.set(surf)
+
+    def build(self, surf):
+        return surf
+
+
+class HUD:
+    def __init__(self, bg=None):
+        self.bg = bg
+        self.widgets = OrderedDict()
+        self.invalid = True
+
+    def add(self, name, widget):
+        self.widgets[name] = widget
+        self.invalid = True
+        return widget
+
+    def remove(self, name):
+        self.widgets.pop(name, None)
+        self.invalid = True
+
+    def set(self, name, value):
+        self.widgets[name].set(value)
+
+    def invalidate(self):
+        self.invalid = True
+
+    def draw(self, surf, force=False):
+        # Returns the rects that changed on surf. force redraws every widget,
+        # for when whatever was under the HUD has been repainted.
+        if self.invalid:
+            if self.bg:
+                surf.fill(self.bg)
+            for widget in self.widgets.values():
+                if widget.surf is None:
+                    continue  # Nothing set yet
+                surf.blit(widget.surf, widget.rect)
+                widget.drawn_rect = widget.rect
+                widget.dirty = False
+            self.invalid = False
+            return [surf.get_rect()]
+
+        dirty = []
+        for widget in self.widgets.values():
+            if widget.surf is None:
+                continue
+            if widget.dirty or force:
+                rect = widget.drawn_rect.union(widget.rect) if widget.dirty else widget.rect
+                if widget.dirty and self.bg:
+                    surf.fill(self.bg, rect)
+                surf.blit(widget.surf, widget.rect)
+                widget.drawn_rect = widget.rect
+                widget.dirty = False
+                dirty.append(rect)
+        return dirty
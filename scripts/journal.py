@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+
+class EditJournal:
+    # Undo/redo for a Tilemap as per-cell deltas: (x, y, before, after) with
+    # states of (type, variant), or None for an empty cell. Offgrid edits are
+    # (tile, added). The oldest steps are dropped past max_deltas.
+    def __init__(self, tilemap, max_deltas=200000):
+        self.tilemap = tilemap
+        self.max_deltas = max_deltas
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+        self.group = None
+        # Changes applied since the autosave last took them, once one is attached
+        self.cell_log = None
+        self.offgrid_log = None
+        tilemap.journal = self
+
+    def clear(self):
+        # Forgets all history, e.g. after the map was reloaded
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self.size = 0
+        self.group = None
+        if self.cell_log is not None:
+            self.cell_log, self.offgrid_log = [], []
+
+    def begin(self):
+        # Everything recorded until end() is one undo step, e.g. a brush stroke
+        if self.group is None:
+            self.group = ([], [])
+
+    def end(self):
+        group, self.group = self.group, None
+        if group and (group[0] or group[1]):
+            self.push(group)
+
+    def record(self, cells, before, after):
+        deltas = [(x, y, old, new) for (x, y), old, new in zip(cells, before, after) if old != new]
+        if deltas:
+            self.add(deltas, [])
+            self.log([(x, y, new) for x, y, old, new in deltas], [])
+
+    def record_offgrid(self, tile, added):
+        self.add([], [(tile, added)])
+        self.log([], [(tile, added)])
+
+    def add(self, deltas, offgrid):
+        self.redo_stack = []
+        if self.group is not None:
+            self.group[0].extend(deltas)
+            self.group[1].extend(offgrid)
+        else:
+            self.push((deltas, offgrid))
+
+    def push(self, step):
+        self.undo_stack.append(step)
+        self.size += len(step[0]) + len(step[1])
+        while self.size > self.max_deltas and len(self.undo_stack) > 1:
+            old = self.undo_stack.popleft()
+            self.size -= len(old[0]) + len(old[1])
+
+    def log(self, cells, offgrid):
+        if self.cell_log is not None:
+            self.cell_log.extend(cells)
+            self.offgrid_log.extend(offgrid)
+
+    def undo(self):
+        self.end()
+        if not self.undo_stack:
+            return False
+        step = self.undo_stack.pop()
+        self.size -= len(step[0]) + len(step[1])
+        deltas, offgrid = step
+        self.apply([(x, y, old) for x, y, old, new in reversed(deltas)], [(tile, not added) for tile, added in reversed(offgrid)])
+        self.redo_stack.append(step)
+        return True
+
+    def redo(self):
+        self.end()
+        if not self.redo_stack:
+            return False
+        step = self.redo_stack.pop()
+        deltas, offgrid = step
+        self.apply([(x, y, new) for x, y, old, new in deltas], offgrid)
+        self.undo_stack.append(step)
+        self.size += len(deltas) + len(offgrid)
+        return True
+
+    def apply(self, cells, offgrid):
+        self.tilemap.restore(cells, offgrid)
+        self.log(cells, offgrid)
+
+
+class Autosave:
+    # Keeps unsaved work of a journaled tilemap in side files, written from a
+    # worker thread. Changes are appended to path + '.autosave.journal' every
+    # interval seconds, and snapshots go to path + '.autosave' and empty the
+    # journal. Only save() writes path itself, and it removes the side
+    # files. The editor thread only hands lists over, so saving a big map
+    # never holds up a frame.
+    def __init__(self, tilemap, journal, path, interval=5, snapshot_interval=60):
+        self.tilemap = tilemap
+        self.journal = journal
+        self.path = path
+        self.autosave_path = path + '.autosave'
+        self.journal_path = self.autosave_path + '.journal'
+        self.interval = interval
+        self.snapshot_interval = snapshot_interval
+        journal.cell_log = []
+        journal.offgrid_log = []
+        self.last_flush = time.monotonic()
+        self.last_snapshot = self.last_flush
+        self.unsaved = False  # Changes since the last snapshot
+        self.error = None  # The last OSError the worker hit, for the editor to show
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def tick(self):
+        # Called every frame; cheap unless a flush or snapshot is due
+        now = time.monotonic()
+        if now - self.last_flush >= self.interval:
+            self.flush()
+        if self.unsaved and now - self.last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        cells, offgrid = self.journal.cell_log, self.journal.offgrid_log
+        if cells or offgrid:
+            self.journal.cell_log, self.journal.offgrid_log = [], []
+            self.jobs.put(('append', cells, offgrid))
+            self.unsaved = True
+
+    def snapshot(self, kind='snapshot'):
+        # The tile dicts are captured here and written by the worker. Later
+        # edits replace or erase dicts rather than move them, and whatever
+        # changes after the capture is in the journal written afterwards.
+        self.flush()
+        self.last_snapshot = time.monotonic()
+        self.unsaved = False
+        self.jobs.put((kind, list(self.tilemap.tilemap.values()), list(self.tilemap.offgrid_tiles), self.tilemap.tile_size))
+
+    def save(self):
+        # Writes path, after which the side files are out of date
+        self.snapshot('save')
+
+    def discard(self):
+        # Forgets the unsaved work; the caller puts the map back
+        self.journal.clear()
+        self.unsaved = False
+        self.jobs.put(('discard',))
+
+    def close(self):
+        # Unsaved changes stay in the side files for recover() to offer
+        self.flush()
+        self.jobs.put(None)
+        self.thread.join()
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                if job[0] == 'append':
+                    self.append(job[1], job[2])
+                elif job[0] == 'snapshot':
+                    self.write_snapshot(self.autosave_path, job[1], job[2], job[3])
+                    self.remove(self.journal_path)
+                elif job[0] == 'save':
+                    self.write_snapshot(self.path, job[1], job[2], job[3])
+                    self.remove(self.autosave_path, self.journal_path)
+                else:
+                    self.remove(self.autosave_path, self.journal_path)
+            except OSError as e:
+                self.error = e
+
+    def append(self, cells, offgrid):
+        line = {
+            'cells': [[x, y] if state is None else [x, y, state[0], state[1]] for x, y, state in cells],
+            'offgrid': [[tile, added] for tile, added in offgrid],
+        }
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps(line) + '\n')
+
+    def write_snapshot(self, path, tiles, offgrid, tile_size):
+        tilemap = {str(tile['pos'][0]) + ';' + str(tile['pos'][1]): tile for tile in tiles}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'tilemap': tilemap, 'tile_size': tile_size, 'offgrid': offgrid}, f)
+        os.replace(temp_path, path)
+
+    def remove(self, *paths):
+        # Whatever these held is in the snapshot just written
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def has_autosave(path):
+    return os.path.exists(path + '.autosave') or os.path.exists(path + '.autosave.journal')
+
+
+def recover(tilemap, path):
+    # Loads the unsaved work an Autosave left for path: its last snapshot
+    # (or path itself) plus the journal written after it. Returns the
+    # number of journal entries replayed.
+    try:
+        tilemap.load(path + '.autosave' if os.path.exists(path + '.autosave') else path)
+    except FileNotFoundError:
+        pass
+    replayed = 0
+    try:
+        with open(path + '.autosave.journal') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Cut off mid-write
+                cells = [(cell[0], cell[1], (cell[2], cell[3]) if len(cell) > 2 else None) for cell in entry['cells']]
+                tilemap.restore(cells, [(tile, added) for tile, added in entry['offgrid']])
+                replayed += 1
+    except FileNotFoundError:
+        pass
+    return replayed
@@ -0,0 +1,103 @@
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.tilemap import Tilemap
+
+MAP_PATH = 'ninja_data/maps/'
+
+
+class LevelTemplate:
+    # A level parsed and extracted once. Games borrow its tile data
+    # copy-on-write, so restarting a level never goes back to disk.
+    def __init__(self, map_id, path=MAP_PATH):
+        tilemap = Tilemap(None, tile_size=16)
+        tilemap.load(path + str(map_id) + '.json')
+
+        leaf_spawners = []
+        for tree in tilemap.extract([('large_decor', 2)], keep=True):
+            leaf_spawners.append((4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
+
+        player_pos = None
+        enemy_positions = []
+        for spawner in tilemap.extract([('spawners', 0), ('spawners', 1)]):
+            if spawner['variant'] == 0:
+                player_pos = tuple(spawner['pos'])
+            else:
+                enemy_positions.append(tuple(spawner['pos']))
+
+        self.map_id = map_id
+        self.tilemap = tilemap.tilemap
+        self.tile_size = tilemap.tile_size
+        self.offgrid_tiles = tilemap.offgrid_tiles
+        self.width = tilemap.width
+        self.height = tilemap.height
+        self.leaf_spawners = tuple(leaf_spawners)
+        self.player_pos = player_pos
+        self.enemy_positions = tuple(enemy_positions)
+        self.spawn_cells = self.reachable_cells(tilemap)
+
+    def leaf_spawner_rects(self):
+        from pygame import Rect
+        return [Rect(rect) for rect in self.leaf_spawners]
+
+    def reachable_cells(self, tilemap):
+        # Flood fill of the open cells connected to the player spawner,
+        # inside the level's tile extents. Levels without a spawner get every
+        # open cell. Sorted so a seeded draw always picks the same cell.
+        x0, y0, x1, y1 = tilemap.bounds()
+        x0, y0, x1, y1 = x0 + 1, y0 + 1, x1 - 1, y1 - 1
+        if self.player_pos is None:
+            return tuple((x, y) for y in range(y0, y1) for x in range(x0, x1) if not tilemap.solid_at(x, y))
+        start = (int(self.player_pos[0] // self.tile_size), int(self.player_pos[1] // self.tile_size))
+        cells = []
+        seen = {start}
+        stack = [start]
+        while stack:
+            x, y = stack.pop()
+            if not (x0 <= x < x1 and y0 <= y < y1) or tilemap.solid_at(x, y):
+                continue
+            cells.append((x, y))
+            for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if cell not in seen:
+                    seen.add(cell)
+                    stack.append(cell)
+        return tuple(sorted(cells))
+
+    def spawn_position(self, rng=random):
+        # Top left pixel of a random open tile the player can reach, or None
+        if not self.spawn_cells:
+            return None
+        x, y = self.spawn_cells[rng.randrange(len(self.spawn_cells))]
+        return (x * self.tile_size, y * self.tile_size)
+
+    def chest_position(self, rng=random):
+        return self.spawn_position(rng) or (0, 0)
+
+
+class LevelLoader:
+    # Parses levels on a worker thread and keeps the templates, so the frame
+    # that switches or restarts a level only has to build entities.
+    def __init__(self, path=MAP_PATH):
+        self.path = path
+        # Read once; map ids are the numeric json files, which need not be contiguous
+        self.map_ids = sorted(int(name[:-5]) for name in os.listdir(path) if name.endswith('.json') and name[:-5].isdigit())
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = {}
+        self.templates = {}
+
+    def next_level(self, map_id):
+        for next_id in self.map_ids:
+            if next_id > map_id:
+                return next_id
+        return self.map_ids[-1]
+
+    def prefetch(self, map_id):
+        if map_id not in self.templates and map_id not in self.pending:
+            self.pending[map_id] = self.pool.submit(LevelTemplate, map_id, self.path)
+
+    def get(self, map_id):
+        if map_id not in self.templates:
+            job = self.pending.pop(map_id, None)
+            self.templates[map_id] = job.result() if job else LevelTemplate(map_id, self.path)
+        return self.templates[map_id]
@@ -0,0 +1,40 @@
+import time
+
+
+class FixedStepLoop:
+    # Accumulates real time and hands out whole simulation steps of 1/rate
+    # seconds. alpha is how far the renderer is between the last two steps.
+    def __init__(self, rate=60, max_steps=5, timer=time.perf_counter):
+        self.rate = rate
+        self.dt = 1 / rate
+        self.max_steps = max_steps  # Cap per frame so a slow frame can't snowball
+        self.timer = timer
+        self.accumulator = 0
+        self.last = None
+        self.dropped = 0  # Steps skipped because of the cap
+
+    def reset(self):
+        # After pauses/menus, so the time spent there isn't simulated
+        self.accumulator = 0
+        self.last = None
+
+    def advance(self):
+        now = self.timer()
+        if self.last is None:
+            # First frame after a reset runs exactly one step
+            self.last = now
+            self.accumulator = self.dt
+        self.accumulator += now - self.last
+        self.last = now
+
+        steps = int(self.accumulator / self.dt)
+        if steps > self.max_steps:
+            self.dropped += steps - self.max_steps
+            steps = self.max_steps
+            self.accumulator = self.dt * steps
+        self.accumulator -= steps * self.dt
+        return steps, self.accumulator / self.dt
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
@@ -0,0 +1,147 @@
+import math
+
+import pygame
+
+from scripts.hud import Widget
+
+TILE_COLORS = {
+    'grass': (74, 160, 64),
+    'stone': (130, 130, 140),
+    'decor': (60, 110, 60),
+    'large_decor': (40, 90, 45),
+    'spawners': (220, 60, 60),
+}
+DEFAULT_COLOR = (200, 200, 200)
+MAX_LEVELS = 6
+
+
+class Minimap:
+    # One pixel per grid tile plus halved mip levels for zooming out. Edits
+    # reach it through the tilemap's listeners and only repaint their cells;
+    # a mip level is brought up to date when it is next drawn, and only
+    # where tiles changed.
+    def __init__(self, tilemap, colors=TILE_COLORS, margin=16):
+        self.tilemap = tilemap
+        self.colors = colors
+        self.margin = margin  # Spare tiles around the map so small growth needs no rebuild
+        self.origin = (0, 0)  # Tile at pixel (0, 0) of the base level
+        self.levels = []
+        self.dirty = []  # Per mip level: changed area in base pixels, or None
+        self.rebuild_needed = True
+        self.version = 0  # Bumped on every change, so views know to redraw
+        tilemap.listeners.append(self.tiles_changed)
+
+    def color(self, tile):
+        if tile is None:
+            return (0, 0, 0, 0)
+        return self.colors.get(tile['type'], DEFAULT_COLOR)
+
+    def rebuild(self):
+        x0, y0, x1, y1 = self.tilemap.bounds()
+        self.origin = (x0 - self.margin, y0 - self.margin)
+        size = (x1 - x0 + self.margin * 2, y1 - y0 + self.margin * 2)
+        base = pygame.Surface(size, pygame.SRCALPHA)
+        base.fill((0, 0, 0, 0))
+        origin_x, origin_y = self.origin
+        for tile in self.tilemap.tilemap.values():
+            base.set_at((tile['pos'][0] - origin_x, tile['pos'][1] - origin_y), self.color(tile))
+
+        self.levels = [base]
+        while len(self.levels) < MAX_LEVELS and min(self.levels[-1].get_size()) > 1:
+            width, height = self.levels[-1].get_size()
+            self.levels.append(pygame.Surface(((width + 1) // 2, (height + 1) // 2), pygame.SRCALPHA))
+        self.dirty = [None] + [base.get_rect()] * (len(self.levels) - 1)
+        self.rebuild_needed = False
+
+    def tiles_changed(self, cells):
+        self.version += 1
+        if cells is None or self.rebuild_needed:
+            self.rebuild_needed = True
+            return
+        base = self.levels[0]
+        width, height = base.get_size()
+        origin_x, origin_y = self.origin
+        tilemap = self.tilemap.tilemap
+        min_x = min_y = math.inf
+        max_x = max_y = -math.inf
+        for x, y in cells:
+            px, py = x - origin_x, y - origin_y
+            if not (0 <= px < width and 0 <= py < height):
+                # Grew past the margin; the whole image is laid out again
+                self.rebuild_needed = True
+                return
+            base.set_at((px, py), self.color(tilemap.get(f'{x};{y}')))
+            min_x, max_x = min(min_x, px), max(max_x, px)
+            min_y, max_y = min(min_y, py), max(max_y, py)
+        if min_x > max_x:
+            return
+        changed = pygame.Rect(min_x, min_y, max_x - min_x + 1, max_y - min_y + 1)
+        for level in range(1, len(self.levels)):
+            self.dirty[level] = changed if self.dirty[level] is None else self.dirty[level].union(changed)
+
+    def level(self, index):
+        # Mip level index (0 is full size), updated where it is out of date
+        if self.rebuild_needed:
+            self.rebuild()
+        index = min(index, len(self.levels) - 1)
+        for level in range(1, index + 1):
+            changed = self.dirty[level]
+            if changed is None:
+                continue
+            scale = 2 ** level
+            # The changed base area in this level's pixels, rounded out to whole pixels
+            x0, y0 = changed.x // scale, changed.y // scale
+            x1, y1 = -(-changed.right // scale), -(-changed.bottom // scale)
+            src = self.levels[level - 1]
+            area = pygame.Rect(x0 * 2, y0 * 2, (x1 - x0) * 2, (y1 - y0) * 2).clip(src.get_rect())
+            if area.w and area.h:
+                part = pygame.transform.smoothscale(src.subsurface(area), ((area.w + 1) // 2, (area.h + 1) // 2))
+                # Cleared then max-blended, which copies pixels without alpha blending
+                self.levels[level].fill((0, 0, 0, 0), (x0, y0, part.get_width(), part.get_height()))
+                self.levels[level].blit(part, (x0, y0), special_flags=pygame.BLEND_RGBA_MAX)
+            self.dirty[level] = None
+        return self.levels[index]
+
+    def draw(self, surf, rect, center, zoom=1):
+        # Draws the level around center (in tiles) into rect of surf, zoom
+        # being pixels per tile. Below 1 a mip level is used, so the cost
+        # depends on the size of rect, not of the map.
+        rect = pygame.Rect(rect)
+        index = max(0, round(-math.log2(zoom))) if zoom < 1 else 0
+        src = self.level(index)
+        index = min(index, len(self.levels) - 1)
+        scale = zoom * 2 ** index  # Screen pixels per pixel of src
+        view = pygame.Rect(0, 0, math.ceil(rect.w / scale), math.ceil(rect.h / scale))
+        view.center = ((center[0] - self.origin[0]) / 2 ** index, (center[1] - self.origin[1]) / 2 ** index)
+        visible = view.clip(src.get_rect())
+        if not (visible.w and visible.h):
+            return
+        part = src.subsurface(visible)
+        dest = (rect.x + int((visible.x - view.x) * scale), rect.y + int((visible.y - view.y) * scale))
+        if scale != 1:
+            part = pygame.transform.scale(part, (int(visible.w * scale), int(visible.h * scale)))
+        surf.blit(part, dest, area=pygame.Rect(0, 0, rect.right - dest[0], rect.bottom - dest[1]))
+
+
+class MinimapWidget(Widget):
+    # A HUD panel; only rebuilt when the map changes or the centre tile moves
+    def __init__(self, minimap, pos, size, zoom=1, bg=(0, 0, 0, 160), marker=(255, 255, 255)):
+        super().__init__(pos)
+        self.minimap = minimap
+        self.size = size
+        self.zoom = zoom
+        self.bg = bg
+        self.marker = marker
+
+    def set(self, center):
+        super().set((self.minimap.version, int(center[0]), int(center[1]), self.zoom))
+
+    def build(self, value):
+        version, x, y, zoom = value
+        surf = pygame.Surface(self.size, pygame.SRCALPHA)
+        surf.fill(self.bg)
+        self.minimap.draw(surf, surf.get_rect(), (x, y), zoom)
+        dot = max(2, int(zoom))
+        pygame.draw.rect(surf, self.marker, (self.size[0] // 2 - dot // 2, self.size[1] // 2 - dot // 2, dot, dot))
+        pygame.draw.rect(surf, self.marker, surf.get_rect(), 1)
+        return surf
@@ -19,7 +19,11 @@ class Particle:
         
         return kill
     
-    def render(self, surf, offset=(0, 0)):
+    def render(self, surf, offset=(0, 0), queue=None):
         img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
+        pos = (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2)
+        if queue:
+            queue.add(img, pos)
+        else:
+            surf.blit(img, pos)
     
\ No newline at end of file
@@ -0,0 +1,119 @@
+import math
+
+import pygame
+
+
+class Presenter:
+    # Scales the low-res display onto the window without allocating a new
+    # full-screen surface every frame.
+    def __init__(self, screen, source_size, clear_color=(0, 0, 0)):
+        self.screen = screen
+        self.source_size = tuple(source_size)
+        self.clear_color = clear_color
+        self.buffer = None
+        self.setup()
+
+    def setup(self):
+        self.size = self.screen.get_size()
+        self.scale_x = self.size[0] / self.source_size[0]
+        self.scale_y = self.size[1] / self.source_size[1]
+        # Integer nearest-neighbour fast path: shake offsets can be applied by
+        # cropping the source instead of scaling into a buffer and blitting it.
+        self.integer = self.scale_x.is_integer() and self.scale_y.is_integer()
+        self.buffer = None
+
+    def compatible(self, surf):
+        return surf.get_bitsize() == self.screen.get_bitsize() and surf.get_masks() == self.screen.get_masks()
+
+    def get_buffer(self, surf):
+        if not self.buffer or self.buffer.get_bitsize() != surf.get_bitsize() or self.buffer.get_masks() != surf.get_masks():
+            self.buffer = pygame.Surface(self.size, 0, surf)
+        return self.buffer
+
+    def present(self, surf, offset=(0, 0)):
+        if self.screen.get_size() != self.size:
+            self.setup()
+
+        if self.integer and self.compatible(surf):
+            self.present_integer(surf, offset)
+            return
+
+        offset = (int(offset[0]), int(offset[1]))
+        if self.compatible(surf):
+            if offset == (0, 0):
+                pygame.transform.scale(surf, self.size, self.screen)
+            else:
+                self.present_cropped(surf, offset)
+            return
+
+        # Only a source in another pixel format needs the intermediate buffer
+        buffer = self.get_buffer(surf)
+        pygame.transform.scale(surf, self.size, buffer)
+        if offset != (0, 0):
+            self.clear_edges(offset)
+        self.screen.blit(buffer, offset)
+
+    def present_cropped(self, surf, offset):
+        # Non-integer scales: the source pixels pushed off screen by the shake
+        # are cropped and the rest is scaled straight into its place on the
+        # screen, so shaking costs no second full-screen pass either.
+        src_x, src_w, dest_x, dest_w = self.span(offset[0], self.source_size[0], self.scale_x, self.size[0])
+        src_y, src_h, dest_y, dest_h = self.span(offset[1], self.source_size[1], self.scale_y, self.size[1])
+        if min(src_w, src_h, dest_w, dest_h) <= 0:
+            self.screen.fill(self.clear_color)
+            return
+        dest_rect = pygame.Rect(dest_x, dest_y, dest_w, dest_h)
+        pygame.transform.scale(surf.subsurface((src_x, src_y, src_w, src_h)), dest_rect.size, self.screen.subsurface(dest_rect))
+        self.clear_outside(dest_rect)
+
+    def span(self, offset, source, scale, size):
+        # Along one axis: (first source pixel, source pixels, screen start,
+        # screen pixels) of what stays visible when shifted by offset
+        cut = math.ceil(abs(offset) / scale)
+        if offset > 0:
+            src, dest = 0, offset
+        else:
+            src, dest = cut, round(offset + cut * scale)
+        return src, source - cut, dest, min(round((source - cut) * scale), size - dest)
+
+    def clear_outside(self, rect):
+        # The strips around rect, which the shifted frame didn't cover
+        w, h = self.size
+        if rect.left > 0:
+            self.screen.fill(self.clear_color, (0, 0, rect.left, h))
+        if rect.right < w:
+            self.screen.fill(self.clear_color, (rect.right, 0, w - rect.right, h))
+        if rect.top > 0:
+            self.screen.fill(self.clear_color, (0, 0, w, rect.top))
+        if rect.bottom < h:
+            self.screen.fill(self.clear_color, (0, rect.bottom, w, h - rect.bottom))
+
+    def present_integer(self, surf, offset):
+        kx, ky = int(self.scale_x), int(self.scale_y)
+        # Shake is snapped to whole source pixels so the cropped source maps
+        # exactly onto the shifted window area.
+        dx, dy = round(offset[0] / kx), round(offset[1] / ky)
+        if dx == 0 and dy == 0:
+            pygame.transform.scale(surf, self.size, self.screen)
+            return
+
+        w, h = self.source_size
+        dx = max(-w + 1, min(w - 1, dx))
+        dy = max(-h + 1, min(h - 1, dy))
+        src_rect = pygame.Rect(max(-dx, 0), max(-dy, 0), w - abs(dx), h - abs(dy))
+        dest_rect = pygame.Rect(max(dx, 0) * kx, max(dy, 0) * ky, src_rect.width * kx, src_rect.height * ky)
+        pygame.transform.scale(surf.subsurface(src_rect), dest_rect.size, self.screen.subsurface(dest_rect))
+        self.clear_edges((dx * kx, dy * ky))
+
+    def clear_edges(self, offset):
+        # Only the strips uncovered by the shifted frame need clearing.
+        w, h = self.size
+        ox, oy = offset
+        if ox > 0:
+            self.screen.fill(self.clear_color, (0, 0, ox, h))
+        elif ox < 0:
+            self.screen.fill(self.clear_color, (w + ox, 0, -ox, h))
+        if oy > 0:
+            self.screen.fill(self.clear_color, (0, 0, w, oy))
+        elif oy < 0:
+            self.screen.fill(self.clear_color, (0, h + oy, w, -oy))
@@ -0,0 +1,129 @@
+import json
+import time
+from collections import deque
+
+from scripts.hud import TextCache
+
+
+class Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.stages.append((self.name, self.start, time.perf_counter() - self.start))
+
+
+class NullScope:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SCOPE = NullScope()
+
+
+class FrameProfiler:
+    # Named timing scopes collected per rendered frame into a ring buffer of
+    # recent frames. Does nothing until enabled.
+    def __init__(self, history=300):
+        self.enabled = False
+        self.overlay = False
+        self.frames = deque(maxlen=history)
+        self.scopes = {}
+        self.stages = []
+        self.frame_start = time.perf_counter()
+        self.text_cache = TextCache()
+        self.overlay_lines = []
+        self.frame_count = 0  # Frames recorded so far; the ring buffer stops growing
+        self.overlay_frame = 0  # frame_count when the overlay text was last built
+
+    def scope(self, name):
+        if not self.enabled:
+            return NULL_SCOPE
+        if name not in self.scopes:
+            self.scopes[name] = Scope(self, name)
+        return self.scopes[name]
+
+    def toggle(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay
+        self.frame_start = time.perf_counter()
+        self.stages = []
+
+    def end_frame(self, **counts):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frames.append((self.frame_start, now - self.frame_start, self.stages, counts))
+        self.frame_count += 1
+        self.frame_start = now
+        self.stages = []
+
+    def averages(self, count=60):
+        # Mean ms per stage (and mean counts) over the last count frames
+        frames = list(self.frames)[-count:]
+        totals = {}
+        counts = {}
+        for start, duration, stages, frame_counts in frames:
+            for name, stage_start, stage_duration in stages:
+                totals[name] = totals.get(name, 0) + stage_duration
+            for name, value in frame_counts.items():
+                counts[name] = counts.get(name, 0) + value
+        n = max(1, len(frames))
+        frame_ms = sum(frame[1] for frame in frames) * 1000 / n
+        return frame_ms, {name: total * 1000 / n for name, total in totals.items()}, {name: value / n for name, value in counts.items()}
+
+    def render_overlay(self, surf, font, pos=(10, 10), color=(255, 255, 0)):
+        if not self.overlay:
+            return
+        # Text only changes twice a second so glyphs aren't rasterised every frame
+        if not self.overlay_lines or self.frame_count - self.overlay_frame >= 30:
+            self.overlay_frame = self.frame_count
+            frame_ms, stages, counts = self.averages()
+            self.overlay_lines = [f'frame {frame_ms:6.2f} ms']
+            self.overlay_lines += [f'{name:<12} {ms:6.2f} ms' for name, ms in sorted(stages.items(), key=lambda s: -s[1])]
+            self.overlay_lines += [f'{name:<12} {value:6.0f}' for name, value in counts.items()]
+        y = pos[1]
+        for line in self.overlay_lines:
+            text = self.text_cache.render(font, line, color)
+            surf.blit(text, (pos[0], y))
+            y += text.get_height()
+
+    def export_csv(self, path):
+        names = []
+        count_names = []
+        for start, duration, stages, counts in self.frames:
+            for name, stage_start, stage_duration in stages:
+                if name not in names:
+                    names.append(name)
+            for name in counts:
+                if name not in count_names:
+                    count_names.append(name)
+        with open(path, 'w') as f:
+            f.write(','.join(['frame', 'frame_ms'] + [name + '_ms' for name in names] + count_names) + '\n')
+            for i, (start, duration, stages, counts) in enumerate(self.frames):
+                totals = dict.fromkeys(names, 0)
+                for name, stage_start, stage_duration in stages:
+                    totals[name] += stage_duration
+                row = [str(i), f'{duration * 1000:.3f}'] + [f'{totals[name] * 1000:.3f}' for name in names]
+                row += [str(counts.get(name, '')) for name in count_names]
+                f.write(','.join(row) + '\n')
+
+    def export_chrome_trace(self, path):
+        # Load in chrome://tracing or Perfetto
+        events = []
+        for i, (start, duration, stages, counts) in enumerate(self.frames):
+            events.append({'name': 'frame', 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': 0, 'tid': 0, 'args': dict(counts, frame=i)})
+            for name, stage_start, stage_duration in stages:
+                events.append({'name': name, 'ph': 'X', 'ts': stage_start * 1e6, 'dur': stage_duration * 1e6, 'pid': 0, 'tid': 0})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,181 @@
+import sys
+import time
+import zlib
+import struct
+import random
+import argparse
+import importlib
+
+import pygame
+
+from scripts.headless import KEYS
+from scripts.loop import FixedStepLoop
+from scripts.simulate import state_digest
+
+MAGIC = b'RPLY'
+VERSION = 2
+# magic, version, seed, map id, frame count, digest of the final state
+HEADER = struct.Struct('<4sBQiI20s')
+
+# One byte per events.get() call, in every state: held movement keys plus
+# the keys pressed that step and whether the window was closed
+HELD_BITS = [(1, KEYS['left']), (2, KEYS['right']), (4, KEYS['up']), (8, KEYS['down'])]
+PRESS_BITS = [(16, KEYS['dash']), (32, pygame.K_RETURN), (64, pygame.K_q)]
+CLOSE_BIT = 128
+
+
+class InputRecorder:
+    # Wraps the game's event source and logs the input state every time the
+    # game reads it, menus included, so deaths and restarts replay too.
+    def __init__(self, game, source=pygame.event):
+        self.game = game
+        self.source = source
+        self.held = 0
+        self.frames = bytearray()
+
+    def get(self):
+        events = self.source.get()
+        pressed = 0
+        for event in events:
+            if event.type == pygame.QUIT:
+                pressed |= CLOSE_BIT
+            for bit, key in HELD_BITS:
+                if getattr(event, 'key', None) == key:
+                    if event.type == pygame.KEYDOWN:
+                        self.held |= bit
+                    elif event.type == pygame.KEYUP:
+                        self.held &= ~bit
+            for bit, key in PRESS_BITS:
+                if event.type == pygame.KEYDOWN and event.key == key:
+                    pressed |= bit
+        self.frames.append(self.held | pressed)
+        return events
+
+    def save(self, path, seed, map_id, game_module):
+        digest = bytes.fromhex(state_digest(self.game))
+        name = game_module.encode()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, seed, map_id, len(self.frames), digest))
+            f.write(struct.pack('<B', len(name)) + name)
+            f.write(zlib.compress(bytes(self.frames), 9))
+
+
+class Recording:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, version, self.seed, self.map_id, count, self.digest = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(path + ' is not a replay file')
+            self.game_module = f.read(f.read(1)[0]).decode()
+            self.frames = zlib.decompress(f.read())
+        if len(self.frames) != count:
+            raise ValueError(path + ' is truncated')
+
+
+class ReplayInput:
+    # Turns recorded input states back into the key events the game reads
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame = 0
+        self.held = 0
+
+    @property
+    def finished(self):
+        return self.frame >= len(self.frames)
+
+    def get(self):
+        pygame.event.pump()
+        state = self.frames[self.frame] if not self.finished else 0
+        self.frame += 1
+        events = []
+        for bit, key in HELD_BITS:
+            if (state ^ self.held) & bit:
+                events.append(pygame.event.Event(pygame.KEYDOWN if state & bit else pygame.KEYUP, key=key))
+        for bit, key in PRESS_BITS:
+            if state & bit:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+                events.append(pygame.event.Event(pygame.KEYUP, key=key))
+        if state & CLOSE_BIT:
+            events.append(pygame.event.Event(pygame.QUIT))
+        self.held = state & 15
+        return events
+
+
+class SteppedLoop(FixedStepLoop):
+    # One simulation step per frame whatever the clock says, so a replay
+    # runs the recorded steps back to back
+    def advance(self):
+        return 1, 1
+
+
+def record(path, game_module='cave', map_id=0, seed=None):
+    # Plays normally from a fresh seeded run; the file is written on exit
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    game = importlib.import_module(game_module).Game(seed=seed)
+    recorder = InputRecorder(game, game.events)
+    game.events = recorder
+    game.reset(seed=seed, map_id=map_id)
+    try:
+        game.run()
+    finally:
+        recorder.save(path, seed, map_id, game_module)
+
+
+def replay(path, headless=True, render=True):
+    # Feeds a recording through the game's own frames, one step each and
+    # unthrottled. Without render the render systems are switched off.
+    recording = Recording(path)
+    game = importlib.import_module(recording.game_module).Game(headless=headless, seed=recording.seed)
+    game.reset(seed=recording.seed, map_id=recording.map_id)
+    game.loop = SteppedLoop(game.loop.rate)
+    events = ReplayInput(recording.frames)
+    game.events = events
+    if not render:
+        for system in game.systems.stages['render']:
+            game.systems.enable(system.name, False)
+
+    frame_times = []
+    while not events.finished:
+        start = time.perf_counter()
+        try:
+            game.frame()
+        except SystemExit:
+            # The player quit here, which is where the recording ends
+            break
+        frame_times.append(time.perf_counter() - start)
+
+    frame_times.sort()
+    count = len(frame_times)
+    return {
+        'frames': count,
+        'mean_ms': sum(frame_times) / count * 1000 if count else 0,
+        'p50_ms': frame_times[count // 2] * 1000 if count else 0,
+        'p95_ms': frame_times[int(count * 0.95)] * 1000 if count else 0,
+        'max_ms': frame_times[-1] * 1000 if count else 0,
+        'reproduced': bytes.fromhex(state_digest(game)) == recording.digest,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record play sessions and replay them as benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_args = commands.add_parser('record')
+    record_args.add_argument('path')
+    record_args.add_argument('--game', default='cave')
+    record_args.add_argument('--map', type=int, default=0)
+    record_args.add_argument('--seed', type=int)
+    play_args = commands.add_parser('play')
+    play_args.add_argument('path')
+    play_args.add_argument('--window', action='store_true')
+    play_args.add_argument('--no-render', action='store_true')
+    play_args.add_argument('--max-p95', type=float, help='fail if the 95th percentile frame time exceeds this many ms')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.path, args.game, args.map, args.seed)
+    else:
+        result = replay(args.path, headless=not args.window, render=not args.no_render)
+        print(f"{result['frames']} frames: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+        print('state reproduced' if result['reproduced'] else 'state DIVERGED from the recording')
+        if not result['reproduced'] or (args.max_p95 is not None and result['p95_ms'] > args.max_p95):
+            sys.exit(1)
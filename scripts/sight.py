@@ -0,0 +1,50 @@
+from scripts.tilemap import line_cells
+
+
+class LineOfSight:
+    # Answers "which of these positions can see the target" for many
+    # enemies at once. Results are kept per source tile for the current
+    # target tile, so a query only casts rays when an enemy or the player
+    # reaches another tile, and any tile edit clears them.
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.target = None
+        self.cache = {}
+        self.rays = 0  # Rays actually cast, for profiling
+        tilemap.listeners.append(self.tiles_changed)
+
+    def tiles_changed(self, cells):
+        self.cache = {}
+
+    def tile(self, pos):
+        return (int(pos[0] // self.tilemap.tile_size), int(pos[1] // self.tilemap.tile_size))
+
+    def visible(self, sources, target):
+        # One bool per source position (pixels), true when no solid tile lies
+        # between its tile and the target's
+        target_tile = self.tile(target)
+        if target_tile != self.target:
+            self.target = target_tile
+            self.cache = {}
+        cache = self.cache
+        solid = {}  # Each grid cell is looked up once however many rays cross it
+        results = []
+        for pos in sources:
+            tile = self.tile(pos)
+            seen = cache.get(tile)
+            if seen is None:
+                seen = cache[tile] = self.cast(tile, target_tile, solid)
+            results.append(seen)
+        return results
+
+    def cast(self, start, end, solid):
+        self.rays += 1
+        solid_at = self.tilemap.solid_at
+        # The end tiles are where the two bodies are, not something between them
+        for cell in line_cells(start, end)[1:-1]:
+            blocked = solid.get(cell)
+            if blocked is None:
+                blocked = solid[cell] = solid_at(cell[0], cell[1])
+            if blocked:
+                return False
+        return True
@@ -0,0 +1,101 @@
+import os
+import time
+import random
+import hashlib
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+
+from scripts.headless import KEYS
+
+# One headless game per worker process, reset between runs
+_games = {}
+
+
+class RandomBot:
+    # Seeded stand-in for the keyboard: holds and releases keys at random
+    def __init__(self, seed, change_chance=0.05):
+        self.rng = random.Random(seed)
+        self.change_chance = change_chance
+        self.held = set()
+
+    def get(self):
+        events = []
+        for key in KEYS.values():
+            if self.rng.random() < self.change_chance:
+                if key in self.held:
+                    self.held.discard(key)
+                    events.append(pygame.event.Event(pygame.KEYUP, key=key))
+                else:
+                    self.held.add(key)
+                    events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+        return events
+
+
+def state_digest(game):
+    state = (
+        game.level,
+        tuple(game.player.pos),
+        game.player.health,
+        tuple(tuple(enemy.pos) for enemy in game.enemies),
+        len(game.particles),
+        game.rng.getstate(),
+    )
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def simulate(game_module, map_id, seed, frames):
+    # Runs one seeded instance; the same arguments always give the same digest
+    if game_module not in _games:
+        _games[game_module] = importlib.import_module(game_module).Game(headless=True)
+    game = _games[game_module]
+    game.reset(seed=seed, map_id=map_id)
+    game.events = RandomBot(seed)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        game.update()
+        if game.state != 'game':
+            break
+    return {
+        'map_id': map_id,
+        'seed': seed,
+        'frames': frames,
+        'seconds': time.perf_counter() - start,
+        'enemies_left': len(game.enemies),
+        'health': game.player.health,
+        'digest': state_digest(game),
+    }
+
+
+def run_many(jobs, workers=None, game_module='cave'):
+    # jobs: iterable of (map_id, seed, frames)
+    jobs = list(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(simulate, [game_module] * len(jobs), *zip(*jobs)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run seeded headless games in parallel')
+    parser.add_argument('--game', default='cave')
+    parser.add_argument('--runs', type=int, default=32)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from scripts.levels import LevelLoader
+    map_ids = LevelLoader().map_ids
+    jobs = [(map_ids[i % len(map_ids)], args.seed + i, args.frames) for i in range(args.runs)]
+
+    start = time.perf_counter()
+    results = run_many(jobs, workers=args.workers, game_module=args.game)
+    elapsed = time.perf_counter() - start
+    repeat = simulate(args.game, *jobs[0])
+
+    for result in results:
+        print(f"map {result['map_id']} seed {result['seed']}: {result['digest'][:12]} health {result['health']} enemies {result['enemies_left']}")
+    print(f'{len(results)} runs in {elapsed:.2f}s ({len(results) / elapsed * 3600:.0f} runs/hour, {args.workers} workers)')
+    print('reproducible' if repeat['digest'] == results[0]['digest'] else 'NOT reproducible')
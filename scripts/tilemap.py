@@ -1,6 +1,6 @@
+import gc
 import json
-
-import pygame
+import math
 
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
@@ -15,8 +15,31 @@ AUTOTILE_MAP = {
 }
 
 NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
+EDGE_OFFSETS = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+AUTOTILE_SHIFTS = sorted(EDGE_OFFSETS)
 PHYSICS_TILES = {'grass', 'stone'}
 AUTOTILE_TYPES = {'grass', 'stone'}
+OFFGRID_CHUNK = 128  # Side in pixels of the buckets offgrid tiles are indexed in
+
+def line_cells(start, end):
+    # Bresenham: the cells between two tile coordinates, inclusive
+    x0, y0 = int(start[0]), int(start[1])
+    x1, y1 = int(end[0]), int(end[1])
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    step_x = 1 if x0 < x1 else -1
+    step_y = 1 if y0 < y1 else -1
+    error = dx + dy
+    cells = [(x0, y0)]
+    while (x0, y0) != (x1, y1):
+        double = 2 * error
+        if double >= dy:
+            error += dy
+            x0 += step_x
+        if double <= dx:
+            error += dx
+            y0 += step_y
+        cells.append((x0, y0))
+    return cells
 
 class Tilemap:
     def __init__(self, game, tile_size=16, width=100, height=100):
@@ -27,15 +50,44 @@ class Tilemap:
         self.width = width  # Number of horizontal tiles
         self.height = height  # Number of vertical tiles
         self.tiles = [[None for _ in range(width)] for _ in range(height)]  # Initialize the grid
+        self.render_queue = None  # Made on the first render without a caller's queue
+        self.shared = False  # Tile data is borrowed from a level template
+        self.listeners = []  # Called with the set of changed cells, or None for all of them
+        self.journal = None  # An EditJournal recording edits for undo
+        self.offgrid_index = None  # Chunk: [(list position, tile)], built when first drawn
+
+    def share(self, tilemap, offgrid_tiles, tile_size):
+        self.tilemap = tilemap
+        self.offgrid_tiles = offgrid_tiles
+        self.tile_size = tile_size
+        self.shared = True
+        self.offgrid_index = None
+        self.notify(None)
+
+    def notify(self, cells):
+        for listener in self.listeners:
+            listener(cells)
+
+    def unshare(self):
+        # Copy-on-write: take private copies before the first change
+        if self.shared:
+            self.tilemap = {loc: dict(tile) for loc, tile in self.tilemap.items()}
+            self.offgrid_tiles = [dict(tile) for tile in self.offgrid_tiles]
+            self.shared = False
+            self.offgrid_index = None
 
     def extract(self, id_pairs, keep=False):
+        if not keep:
+            self.unshare()
         matches = []
         for tile in self.offgrid_tiles[:]:
             if (tile['type'], tile['variant']) in id_pairs:
                 matches.append(tile.copy())
                 if not keep:
                     self.offgrid_tiles.remove(tile)
+                    self.offgrid_index = None
 
+        removed = set()
         for loc in list(self.tilemap.keys()):
             tile = self.tilemap[loc]
             if (tile['type'], tile['variant']) in id_pairs:
@@ -45,6 +97,9 @@ class Tilemap:
                 matches[-1]['pos'][1] *= self.tile_size
                 if not keep:
                     del self.tilemap[loc]
+                    removed.add((tile['pos'][0], tile['pos'][1]))
+        if removed:
+            self.notify(removed)
         return matches
 
     def tiles_around(self, pos):
@@ -66,6 +121,9 @@ class Tilemap:
         self.tilemap = map_data['tilemap']
         self.tile_size = map_data['tile_size']
         self.offgrid_tiles = map_data['offgrid']
+        self.shared = False
+        self.offgrid_index = None
+        self.notify(None)
 
     def solid_check(self, pos):
         tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
@@ -73,25 +131,215 @@ class Tilemap:
             if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
                 return self.tilemap[tile_loc]
 
-    def physics_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size))
-        return rects
+    def solid_at(self, x, y):
+        tile = self.tilemap.get(f'{x};{y}')
+        return tile is not None and tile['type'] in PHYSICS_TILES
+
+    def sweep(self, pos, size, axis, distance):
+        # Moves a box (pos, size in pixels) along one axis (0 = x, 1 = y) and
+        # stops it at the first solid tile. Walks only the rows or columns the
+        # leading edge crosses, so the cost doesn't grow with speed beyond
+        # the tiles actually passed. Tiles the box already overlaps are
+        # ignored. Returns (distance moved, contact time 0-1, normal), with
+        # time 1 and normal None when nothing was hit.
+        if not distance:
+            return 0, 1, None
+        tile_size = self.tile_size
+        other = 1 - axis
+        # Tiles covered across the direction of motion
+        first = int(pos[other] // tile_size)
+        last = math.ceil((pos[other] + size[other]) / tile_size) - 1
+
+        if distance > 0:
+            edge = pos[axis] + size[axis]
+            start = math.ceil(edge / tile_size)
+            end = math.ceil((edge + distance) / tile_size) - 1
+            step = 1
+        else:
+            edge = pos[axis]
+            start = math.floor(edge / tile_size) - 1
+            end = math.floor((edge + distance) / tile_size)
+            step = -1
+
+        for line in range(start, end + step, step):
+            for across in range(first, last + 1):
+                if self.solid_at(line, across) if axis == 0 else self.solid_at(across, line):
+                    moved = (line * tile_size if step > 0 else (line + 1) * tile_size) - edge
+                    normal = (-step, 0) if axis == 0 else (0, -step)
+                    return moved, moved / distance, normal
+        return distance, 1, None
 
     def autotile(self):
-        for loc in list(self.tilemap.keys()):
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
+        self.unshare()
+        cells = [tuple(tile['pos']) for tile in self.tilemap.values()]
+        before = self.cell_states(cells) if self.journal is not None else None
+        self.autotile_cells(cells)
+        if before is not None:
+            self.journal.record(cells, before, self.cell_states(cells))
+
+    def autotile_cells(self, cells):
+        # Picks variants for just these cells, so an edit only touches its area
+        tilemap = self.tilemap
+        for x, y in cells:
+            tile = tilemap.get(f'{x};{y}')
+            if tile is None or tile['type'] not in AUTOTILE_TYPES:
+                continue
+            tile_type = tile['type']
+            # Shifts are checked in sorted order, so the key needs no sorting
+            neighbors = []
+            for shift_x, shift_y in AUTOTILE_SHIFTS:
+                neighbor = tilemap.get(f'{x + shift_x};{y + shift_y}')
+                if neighbor is not None and neighbor['type'] == tile_type:
+                    neighbors.append((shift_x, shift_y))
+            variant = AUTOTILE_MAP.get(tuple(neighbors))
+            if variant is not None:
+                tile['variant'] = variant
+
+    def set_tiles(self, cells, tile_type, variant=0, autotile=True):
+        # Bulk edit as one batch: tile_type None erases. The changed cells and
+        # their neighbours are autotiled once and listeners are told once.
+        self.unshare()
+        # Creating many tile dicts would otherwise set off repeated collections
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if self.journal is None:
+                changed = self.apply_tiles(cells, tile_type, variant)
+                if autotile and changed:
+                    self.autotile_cells(self.around(changed))
+            else:
+                # The journal needs the states of everything the edit may touch
+                cells = list(cells)
+                area = list(self.around(cells)) if autotile else cells
+                before = self.cell_states(area)
+                changed = self.apply_tiles(cells, tile_type, variant)
+                if autotile and changed:
+                    self.autotile_cells(area)
+                if changed:
+                    self.journal.record(area, before, self.cell_states(area))
+        finally:
+            if collecting:
+                gc.enable()
+
+        if changed:
+            self.notify(changed)
+        return changed
+
+    def around(self, cells):
+        area = set(cells)
+        for x, y in cells:
+            for shift in EDGE_OFFSETS:
+                area.add((x + shift[0], y + shift[1]))
+        return area
+
+    def cell_states(self, cells):
+        # (type, variant) per cell, None where empty
+        states = []
+        for x, y in cells:
+            tile = self.tilemap.get(f'{x};{y}')
+            states.append((tile['type'], tile['variant']) if tile else None)
+        return states
+
+    def restore(self, cells, offgrid=()):
+        # Puts back exact states, as (x, y, state) and (offgrid tile, added)
+        # pairs. Used by undo and recovery, so it is not journaled itself.
+        self.unshare()
+        for x, y, state in cells:
+            if state is None:
+                self.tilemap.pop(f'{x};{y}', None)
+            else:
+                self.tilemap[f'{x};{y}'] = {'type': state[0], 'variant': state[1], 'pos': [x, y]}
+        for tile, added in offgrid:
+            if added:
+                if tile not in self.offgrid_tiles:  # Replaying a journal twice must not duplicate
+                    self.offgrid_tiles.append(tile)
+            elif tile in self.offgrid_tiles:
+                self.offgrid_tiles.remove(tile)
+        if offgrid:
+            self.offgrid_index = None
+        self.notify({(x, y) for x, y, state in cells})
+
+    def add_offgrid(self, tile):
+        self.unshare()
+        self.offgrid_tiles.append(tile)
+        self.offgrid_index = None
+        if self.journal is not None:
+            self.journal.record_offgrid(tile, True)
+
+    def remove_offgrid(self, tile):
+        self.unshare()
+        self.offgrid_tiles.remove(tile)
+        self.offgrid_index = None
+        if self.journal is not None:
+            self.journal.record_offgrid(tile, False)
+
+    def apply_tiles(self, cells, tile_type, variant):
+        tilemap = self.tilemap
+        changed = set()
+        if tile_type is None:
+            for x, y in cells:
+                if tilemap.pop(f'{x};{y}', None) is not None:
+                    changed.add((x, y))
+        else:
+            new_tiles = {}
+            for x, y in cells:
+                new_tiles[f'{x};{y}'] = {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+                changed.add((x, y))
+            tilemap.update(new_tiles)
+        return changed
+
+    def fill_rect(self, start, end, tile_type, variant=0, autotile=True):
+        # Corners are tile coordinates in any order, both inclusive
+        x0, x1 = sorted((int(start[0]), int(end[0])))
+        y0, y1 = sorted((int(start[1]), int(end[1])))
+        return self.set_tiles([(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)], tile_type, variant, autotile)
+
+    def bounds(self):
+        # Tile extents of the grid plus a one tile margin, as (x0, y0, x1, y1) with x1/y1 exclusive
+        if not self.tilemap:
+            return (0, 0, self.width, self.height)
+        xs = [tile['pos'][0] for tile in self.tilemap.values()]
+        ys = [tile['pos'][1] for tile in self.tilemap.values()]
+        return (min(xs) - 1, min(ys) - 1, max(xs) + 2, max(ys) + 2)
+
+    def flood_fill(self, start, tile_type, variant=0, bounds=None, autotile=True):
+        # Replaces the 4-connected region of cells holding what start holds
+        # (a tile type, or nothing). Iterative so huge regions can't hit the
+        # recursion limit; empty regions stop at bounds.
+        tilemap = self.tilemap
+        start = (int(start[0]), int(start[1]))
+        target = tilemap.get(str(start[0]) + ';' + str(start[1]))
+        target_type = target['type'] if target else None
+        if target_type == tile_type:
+            return set()
+        x0, y0, x1, y1 = bounds or self.bounds()
+
+        cells = []
+        seen = {start}
+        stack = [start]
+        while stack:
+            x, y = stack.pop()
+            if not (x0 <= x < x1 and y0 <= y < y1):
+                continue
+            tile = tilemap.get(f'{x};{y}')
+            if (tile['type'] if tile else None) != target_type:
+                continue
+            cells.append((x, y))
+            for shift in EDGE_OFFSETS:
+                cell = (x + shift[0], y + shift[1])
+                if cell not in seen:
+                    seen.add(cell)
+                    stack.append(cell)
+        return self.set_tiles(cells, tile_type, variant, autotile)
+
+    def paint_line(self, start, end, tile_type, variant=0, radius=0, autotile=True):
+        # A brush stroke: every cell on the line, widened to a square brush
+        cells = set()
+        for x, y in line_cells(start, end):
+            for dy in range(-radius, radius + 1):
+                for dx in range(-radius, radius + 1):
+                    cells.add((x + dx, y + dy))
+        return self.set_tiles(cells, tile_type, variant, autotile)
 
     def is_walkable(self, position):
         x,y = int(position[0]) , int(position[1])
@@ -107,12 +355,48 @@ class Tilemap:
             return tile.solid if tile else False  # Check if tile exists
         return False
 
-    def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
+    def index_offgrid(self):
+        # Each tile goes in every chunk its image covers
+        index = {}
+        assets = self.game.assets
+        for order, tile in enumerate(self.offgrid_tiles):
+            img = assets[tile['type']][tile['variant']]
+            x, y = tile['pos']
+            for chunk_x in range(int(x // OFFGRID_CHUNK), int((x + img.get_width()) // OFFGRID_CHUNK) + 1):
+                for chunk_y in range(int(y // OFFGRID_CHUNK), int((y + img.get_height()) // OFFGRID_CHUNK) + 1):
+                    index.setdefault((chunk_x, chunk_y), []).append((order, tile))
+        self.offgrid_index = index
+
+    def offgrid_in(self, rect):
+        # Offgrid tiles in the chunks rect (pixels) touches, in list order
+        if self.offgrid_index is None:
+            self.index_offgrid()
+        index = self.offgrid_index
+        x, y, w, h = rect
+        found = {}
+        for chunk_x in range(int(x // OFFGRID_CHUNK), int((x + w) // OFFGRID_CHUNK) + 1):
+            for chunk_y in range(int(y // OFFGRID_CHUNK), int((y + h) // OFFGRID_CHUNK) + 1):
+                for order, tile in index.get((chunk_x, chunk_y), ()):
+                    found[order] = tile
+        return [found[order] for order in sorted(found)]
+
+    def render(self, surf, offset=(0, 0), queue=None):
+        # Draws are batched; without a caller's queue they are flushed here
+        flush = queue is None
+        if flush:
+            if self.render_queue is None:
+                from scripts.atlas import RenderQueue
+                self.render_queue = RenderQueue()
+            queue = self.render_queue
+        draw = queue.draws.append
+        assets = self.game.assets
+        for tile in self.offgrid_in((offset[0], offset[1], surf.get_width(), surf.get_height())):
+            draw((assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1])))
         for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
             for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
                 loc = str(x) + ';' + str(y)
                 if loc in self.tilemap:
                     tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+                    draw((assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1])))
+        if flush:
+            queue.flush(surf)
@@ -0,0 +1,38 @@
+import pygame
+
+# Mask frames are shared by every overlay with the same size and settings
+_frame_cache = {}
+
+
+class IrisTransition:
+    # Black overlay with a circular hole that closes as abs(transition) goes
+    # from 0 to steps. Every frame is built once up front so transitions
+    # don't allocate while the next level is loading.
+    def __init__(self, size, steps=30, speed=8, color=(0, 0, 0)):
+        self.size = tuple(size)
+        self.steps = steps
+        self.speed = speed
+        self.color = color
+        key = (self.size, steps, speed, tuple(color))
+        if key not in _frame_cache:
+            _frame_cache[key] = self.build_frames()
+        self.frames = _frame_cache[key]
+
+    def build_frames(self):
+        frames = [None]
+        center = (self.size[0] // 2, self.size[1] // 2)
+        for step in range(1, self.steps + 1):
+            surf = pygame.Surface(self.size)
+            surf.fill(self.color)
+            pygame.draw.circle(surf, (255, 255, 255), center, (self.steps - step) * self.speed)
+            surf.set_colorkey((255, 255, 255), pygame.RLEACCEL)
+            frames.append(surf)
+        return frames
+
+    def frame(self, transition):
+        return self.frames[min(abs(int(transition)), self.steps)]
+
+    def render(self, surf, transition):
+        frame = self.frame(transition)
+        if frame:
+            surf.blit(frame, (0, 0))
@@ -8,22 +8,27 @@ def load_image(path):
     img.set_colorkey((0,0,0))
     return img
 
+def image_names(path):
+    # Sorted so frame and variant order doesn't depend on the filesystem
+    return sorted(os.listdir(BASE_IMG_PATH + path))
+
 def load_images(path):
     images =[]
-    for img_name in os.listdir(BASE_IMG_PATH + path):
+    for img_name in image_names(path):
         images.append(load_image(path + '/'+ img_name))
     return images
 
 class Animation:
-    def __init__(self , images, img_dur=5 , loop = True):
+    def __init__(self , images, img_dur=5 , loop = True, flipped=None):
         self.images = images
+        self.flipped = flipped  # Pre-flipped frames, e.g. from an atlas
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
         self.frame = 0
     
     def copy(self):
-        return Animation(self.images, self.img_duration , self.loop)
+        return Animation(self.images, self.img_duration , self.loop, self.flipped)
     
     def update(self):
         if self.loop:
@@ -33,5 +38,9 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1 :
                 self.done = True
 
-    def img(self):
+    def img(self, flip=False):
+        if flip:
+            if self.flipped:
+                return self.flipped[int(self.frame /self.img_duration)]
+            return pygame.transform.flip(self.images[int(self.frame /self.img_duration)], True, False)
         return self.images[int(self.frame /self.img_duration)]
\ No newline at end of file